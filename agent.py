@@ -1,10 +1,21 @@
 # agent.py
 
-import sqlite3
 import pandas as pd
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Tuple
 
-from llm_client import call_llm, generate_sql_from_question
+import answer_cache
+from context_builder import aggregate_side_effects, build_source_map, format_frequency_table, unique_terms
+from context_packer import CONTEXT_TOKEN_BUDGET, ContextItem, count_tokens, pack, relevance
+from db import read_connection
+from llm_client import DEFAULT_MODEL, LLMError, call_llm, generate_sql_from_question, stream_llm
+from sql_guard import execute_guarded
+from retrieval import (
+    fetch_medication_stats, query_terms, resolve_medication, search_passages,
+    search_side_effects_in_db, search_side_effects_in_df,
+)
+
+
+TOP_K_PASSAGES = 6
 
 
 # ---------------------------------------------------------
@@ -27,93 +38,185 @@ Format example:
 """
 
 
-# ---------------------------------------------------------
-# Build source map: side_effect → [sources]
-# ---------------------------------------------------------
-def build_source_map(csv_rows: pd.DataFrame, docs: List[Dict]) -> Dict[str, List[str]]:
-    source_map = {}
-
-    # SQLite rows
-    for _, row in csv_rows.iterrows():
-        se = row["side_effect"].strip().lower()
-        source_map.setdefault(se, []).append("FDA Data from SQLite")
-
-    # Scraped docs
-    for d in docs:
-        url = d.get("url", "")
-        domain = url.split("/")[2] if "://" in url else url
-        for se in d.get("side_effects", []):
-            se_norm = se.strip().lower()
-            source_map.setdefault(se_norm, []).append(domain)
-
-    return source_map
-
-
 # ---------------------------------------------------------
 # Build LLM context
 # ---------------------------------------------------------
-def build_context(
+def pack_context(
     csv_rows: pd.DataFrame,
     docs: List[Dict],
-    source_map: Dict[str, List[str]]
-) -> str:
+    source_map: Dict[str, List[str]],
+    passages: List[Dict] | None = None,
+    question: str = "",
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    stats: pd.DataFrame | None = None
+) -> Tuple[str, Dict]:
+    """
+    Build the context within `token_budget` tokens.
+
+    Section headers and the code legend are always included. Source-map
+    entries, aggregated side effects, per-document side-effect lists and
+    passages compete for the rest, ranked by relevance to the question
+    (plus report frequency for FDA rows). Returns the context text and
+    the packing report (see context_packer.pack).
+
+    When `passages` is None each document contributes a fixed-length
+    excerpt instead. When `stats` (pre-aggregated rows of the medication,
+    see aggregates.py) is given, the structured section is built from it
+    instead of aggregating `csv_rows`.
+    """
+    terms = query_terms(question)
+    items: List[ContextItem] = []
+    order = 0
+
+    def add(section: str, text: str, score: float) -> None:
+        nonlocal order
+        items.append(ContextItem(section, text, score, order))
+        order += 1
+
+    # One score per side effect, shared by its source-map entry and its
+    # frequency line so the two are kept or dropped together
+    if stats is not None and not stats.empty:
+        agg = stats
+    else:
+        agg = aggregate_side_effects(csv_rows) if not csv_rows.empty else None
+    top = max(int(agg["reports"].max()), 1) if agg is not None and len(agg) else 1
+    reports = dict(zip(agg["side_effect"], agg["reports"])) if agg is not None else {}
 
-    parts = []
+    def se_score(se: str, sources: List[str]) -> float:
+        # question match > web corroboration > report frequency
+        return 3 * relevance(se, terms) + 0.5 * (len(sources) - 1) + reports.get(se, 0) / top
 
     # ---- SOURCE MAP ----
-    parts.append("SOURCE MAP:")
     for se, sources in source_map.items():
-        parts.append(f"- {se}: {', '.join(sources)}")
+        add("source_map", f"- {se}: {', '.join(sources)}", se_score(se, sources))
 
     # ---- STRUCTURED DATA ----
-    parts.append("\nSTRUCTURED DATA (FDA Data from SQLite):")
+    legend = ""
+    if agg is not None:
+        # One line per side effect (report counts + breakdowns), not per report
+        if agg is stats:
+            counts = (
+                f"{int(agg['reports'].sum())} adverse-event reports for this medication "
+                f"(top {len(agg)} side effects). "
+                "PRR / ROR: how much more often the side effect is reported with this "
+                "medication than with all others (above 1 = more often; a signal, not proof). "
+            )
+        else:
+            counts = f"{len(csv_rows)} adverse-event reports, {len(agg)} distinct side effects. "
+        legend = (
+            counts +
+            "Outcome codes: DE death, LT life-threatening, HO hospitalization, "
+            "DS disability, CA congenital anomaly, RI required intervention, OT other serious. "
+            "Roles: PS primary suspect, SS secondary suspect, C concomitant, I interacting, "
+            "DN not administered."
+        )
+        for line, se in zip(format_frequency_table(agg), agg["side_effect"]):
+            add("structured", line, se_score(se, source_map.get(se, [])) + 0.01)
 
-    if csv_rows.empty:
-        parts.append("No structured data found for this medication.")
-    else:
-        for _, row in csv_rows.iterrows():
-            # Add all columns dynamically
-            cols = []
-            for col in row.index:
-                val = row[col]
-                if pd.notna(val) and str(val).strip():
-                    cols.append(f"{col}: {val}")
+    # ---- SCRAPED DOCUMENTS ----
+    for d in docs:
+        url = d.get("url", "")
+        se_list = unique_terms(d.get("side_effects", []))
+        if se_list:
+            text = "Extracted side effects: " + ", ".join(se_list)
+            add(f"doc:{url}", text, 1 + relevance(text, terms))
 
-            parts.append("- " + " | ".join(cols))
+        if passages is None:
+            excerpt = (d.get("text") or "")[:600].replace("\n", " ")
+            add(f"doc:{url}", "Excerpt: " + excerpt, 0.5 + relevance(excerpt, terms))
+            continue
+
+        for rank, p in enumerate(p for p in passages if p["url"] == url):
+            heading = f"{p['heading']}: " if p.get("heading") else ""
+            add(f"doc:{url}", f"Passage [{p['id']}]: {heading}{p['text']}",
+                2 * relevance(heading + p["text"], terms) + 0.5 / (rank + 1))
+
+    fixed = [
+        "SOURCE MAP:",
+        "\nSTRUCTURED DATA (FDA Data from SQLite):",
+        legend or "No structured data found for this medication.",
+        "\nSCRAPED WEB DOCUMENTS:",
+    ] + [f"\nSource: {d.get('url', '')}" for d in docs]
+    kept, report = pack(items, token_budget, reserved=sum(count_tokens(t) + 1 for t in fixed))
+
+    # ---- Render kept items in their original order ----
+    by_section: Dict[str, List[str]] = {}
+    for item in kept:
+        by_section.setdefault(item.section, []).append(item.text)
+
+    parts = ["SOURCE MAP:"]
+    parts.extend(by_section.get("source_map", []))
 
+    parts.append("\nSTRUCTURED DATA (FDA Data from SQLite):")
+    parts.append(legend or "No structured data found for this medication.")
+    parts.extend(by_section.get("structured", []))
 
-    # ---- SCRAPED DOCUMENTS ----
     parts.append("\nSCRAPED WEB DOCUMENTS:")
     if not docs:
         parts.append("No scraped documents available.")
-    else:
-        for d in docs:
-            url = d.get("url", "")
-            se_list = d.get("side_effects", [])
-            excerpt = (d.get("text") or "")[:600].replace("\n", " ")
+    for d in docs:
+        url = d.get("url", "")
+        parts.append(f"\nSource: {url}")
+        parts.extend(by_section.get(f"doc:{url}", []))
+
+    # Report drops per kind, not per document
+    dropped: Dict[str, int] = {}
+    for section, n in report["dropped"].items():
+        kind = "passage/doc" if section.startswith("doc:") else section
+        dropped[kind] = dropped.get(kind, 0) + n
+    report["dropped"] = dropped
 
-            parts.append(f"\nSource: {url}")
-            if se_list:
-                parts.append("Extracted side effects: " + ", ".join(se_list))
-            parts.append("Excerpt: " + excerpt)
+    return "\n".join(parts), report
 
-    return "\n".join(parts)
+
+def build_context(
+    csv_rows: pd.DataFrame,
+    docs: List[Dict],
+    source_map: Dict[str, List[str]],
+    passages: List[Dict] | None = None,
+    question: str = "",
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    stats: pd.DataFrame | None = None
+) -> str:
+    """
+    Context text only; see pack_context.
+    """
+    return pack_context(csv_rows, docs, source_map, passages, question, token_budget, stats)[0]
 
 
 # ---------------------------------------------------------
-# Main agent entry point
+# Pipeline steps (see pipeline.py for how they are scheduled)
 # ---------------------------------------------------------
-def answer_question(
+def generate_sql(question: str, med_filter: str | None = None) -> str | None:
+    """
+    LLM‑generated (or template‑cached) SQL, or None if generation failed.
+    """
+    try:
+        return generate_sql_from_question(question, med_filter)
+    except Exception:
+        return None
+
+
+def fetch_stats(med_filter: str | None) -> pd.DataFrame | None:
+    """
+    Pre-aggregated statistics of the medication, or None if unavailable
+    (the context is then aggregated from the retrieved rows).
+    """
+    try:
+        return fetch_medication_stats(med_filter)
+    except Exception:
+        return None
+
+
+def retrieve_rows(
     df: pd.DataFrame,
-    docs: List[Dict],
     question: str,
-    med_filter: str | None = None
-) -> Tuple[str, pd.DataFrame, List[Dict]]:
+    med_filter: str | None = None,
+    sql: str | None = None
+) -> pd.DataFrame:
     """
-    Returns:
-        answer_text: str
-        csv_rows_subset: pd.DataFrame
-        docs_used_subset: list[dict]
+    Structured rows for the question: the generated SQL if it ran and
+    returned rows, otherwise the indexed keyword + medication search.
     """
 
     # -----------------------------------------------------
@@ -121,64 +224,69 @@ def answer_question(
     # -----------------------------------------------------
     df_sql = pd.DataFrame()
 
-    try:
-        sql = generate_sql_from_question(question, med_filter)
-        conn = sqlite3.connect("DrugData/CapstoneRJ.db")
-        sql = sql 
-
-        df_sql1 = pd.read_sql_query(sql, conn)
-        df_sql = df_sql1.head(200)
+    if sql:
+        try:
+            # Row limit, plan check and time budget are enforced inside SQLite
+            with read_connection() as conn:
+                df_sql = execute_guarded(conn, sql, max_rows=200)
+        except Exception as e:
+            # SQL failed, was unsafe, scanned the table or ran out of
+            # time — fallback to the indexed keyword search
+            df_sql = pd.DataFrame() 
 
-        # print ( " .......................")
-        # print ( df_sql)   
-        conn.close()
-    except Exception as e:
-        # SQL failed — fallback to keyword filtering
-        df_sql = pd.DataFrame() 
+    if not df_sql.empty:
+        return df_sql
 
     # -----------------------------------------------------
-    # 2. Fallback: keyword + medication filtering
+    # 2. Fallback: indexed keyword + medication search
     # -----------------------------------------------------
-    if df_sql.empty:
-        if med_filter:
-            df_filtered = df[df["medication"].str.contains(med_filter, case=False, na=False)]
-        else:
-            df_filtered = df
+    try:
+        return search_side_effects_in_db(question, med_filter, top_k=1000)
+    except Exception:
+        # DB or FTS index unavailable — BM25 over the in-memory frame
+        return search_side_effects_in_df(df, question, top_k=1000, med_filter=med_filter)
 
-        # Keyword match inside side_effect or notes
-        q = question.lower()
-        mask = (
-            df_filtered["side_effect"].str.lower().str.contains(q) |
-            df_filtered.get("outcome", pd.Series([""] * len(df_filtered))).str.lower().str.contains(q)
-        )
-        df_final = df_filtered[mask].head(1000)
-    else:
-        df_final = df_sql
+
+def build_prompt(
+    csv_rows: pd.DataFrame,
+    docs: List[Dict],
+    question: str,
+    stats: pd.DataFrame | None = None
+) -> Dict:
+    """
+    Build the answer prompt from retrieved rows, pre-aggregated
+    medication statistics (if any) and scraped docs.
+    Returns:
+        {
+          "messages": list[dict],
+          "csv_rows": pd.DataFrame,
+          "stats": pd.DataFrame | None,
+          "docs": list[dict],
+          "cache_key": str,
+          "cache_version": str,
+          "packing": dict        # token budget report, see pack_context
+        }
+    """
 
     # -----------------------------------------------------
-    # 3. Scraped docs already filtered by app.py
+    # 3. Scraped docs already filtered by app.py;
+    #    rank their passages against the question
     # -----------------------------------------------------
     doc_hits = docs
+    passages = search_passages(doc_hits, question, top_k=TOP_K_PASSAGES)
 
     # -----------------------------------------------------
     # 4. Build source map
     # -----------------------------------------------------
-    source_map = build_source_map(df_final, doc_hits)
+    fda_rows = csv_rows
+    if stats is not None and not stats.empty:
+        fda_rows = pd.concat([csv_rows.reindex(columns=["side_effect"]), stats[["side_effect"]]])
+    source_map = build_source_map(fda_rows, doc_hits)
 
     # -----------------------------------------------------
     # 5. Build LLM context
     # -----------------------------------------------------
-    
-    # print ( " .......................")
-    # print ( df_final)
-
-    # print ( " .......................")
-    # print ( doc_hits)
-
-    # print ( " .......................")
-    # print ( source_map)
-
-    context = build_context(df_final, doc_hits, source_map)
+    context, packing = pack_context(csv_rows, doc_hits, source_map, passages, question, stats=stats)
 
     messages = [
         {
@@ -187,20 +295,112 @@ def answer_question(
         }
     ]
 
-    # -----------------------------------------------------
-    # 6. Call LLM
-    # -----------------------------------------------------
-    answer = call_llm(
-        system_prompt=SYSTEM_PROMPT,
-        messages=messages,
-    )
+    # Same model + prompt + context + question -> same answer (cached)
+    return {
+        "messages": messages,
+        "csv_rows": csv_rows,
+        "stats": stats,
+        "docs": doc_hits,
+        "cache_key": answer_cache.make_key(DEFAULT_MODEL, SYSTEM_PROMPT, context, question),
+        "cache_version": answer_cache.data_version(doc_hits),
+        "packing": packing,
+    }
+
+
+def prepare_answer(
+    df: pd.DataFrame,
+    docs: List[Dict],
+    question: str,
+    med_filter: str | None = None
+) -> Dict:
+    """
+    Run retrieval and build the answer prompt, one step after another
+    (see build_prompt for the returned dict).
+    """
+    med_filter = resolve_medication(med_filter)
+    sql = generate_sql(question, med_filter)
+    csv_rows = retrieve_rows(df, question, med_filter, sql)
+    return build_prompt(csv_rows, docs, question, fetch_stats(med_filter))
+
+
+def format_llm_error(error: LLMError) -> str:
+    return f"LLM error: {error}"
+
+
+def answer_prepared(prepared: Dict) -> str:
+    """
+    LLM answer for a prompt from build_prompt / prepare_answer, or an
+    "LLM error: ..." message if the request failed.
+    """
+    try:
+        return call_llm(
+            system_prompt=SYSTEM_PROMPT,
+            messages=prepared["messages"],
+            cache_key=prepared["cache_key"],
+            cache_version=prepared["cache_version"],
+        )
+    except LLMError as e:
+        return format_llm_error(e)
+
+
+def stream_prepared(prepared: Dict) -> Iterator[str]:
+    """
+    Streaming counterpart of answer_prepared; a failure ends the stream
+    with the error message.
+    """
+    try:
+        yield from stream_llm(
+            system_prompt=SYSTEM_PROMPT,
+            messages=prepared["messages"],
+            cache_key=prepared["cache_key"],
+            cache_version=prepared["cache_version"],
+        )
+    except LLMError as e:
+        yield format_llm_error(e)
+
+
+# ---------------------------------------------------------
+# Main agent entry point
+# ---------------------------------------------------------
+def answer_question(
+    df: pd.DataFrame,
+    docs: List[Dict],
+    question: str,
+    med_filter: str | None = None
+) -> Tuple[str, pd.DataFrame, List[Dict]]:
+    """
+    Returns:
+        answer_text: str
+        csv_rows_subset: pd.DataFrame
+        docs_used_subset: list[dict]
+    """
+    prepared = prepare_answer(df, docs, question, med_filter)
+
+    answer = answer_prepared(prepared)
 
-    # -----------------------------------------------------
-    # 7. Return everything to app.py
-    # -----------------------------------------------------
     print ( " ......===========.................")
-    print ( messages)
+    print ( prepared["messages"])
     print ( " ......===========.................")
     print ( answer)
 
-    return answer, df_final, doc_hits
+    return answer, prepared["csv_rows"], prepared["docs"]
+
+
+# ---------------------------------------------------------
+# Streaming entry point
+# ---------------------------------------------------------
+def answer_question_stream(
+    df: pd.DataFrame,
+    docs: List[Dict],
+    question: str,
+    med_filter: str | None = None
+) -> Tuple[Iterator[str], pd.DataFrame, List[Dict]]:
+    """
+    Like answer_question, but returns as soon as retrieval is done:
+        answer_tokens: iterator of text chunks (LLM call starts on first next())
+        csv_rows_subset: pd.DataFrame
+        docs_used_subset: list[dict]
+    """
+    prepared = prepare_answer(df, docs, question, med_filter)
+
+    return stream_prepared(prepared), prepared["csv_rows"], prepared["docs"]
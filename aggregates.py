@@ -0,0 +1,220 @@
+# aggregates.py
+#
+# Materialized per-medication statistics, built once after each data
+# load instead of summarizing raw reports on every question:
+#
+#   side_effect_stats(medication, side_effect, reports,
+#                     DE, LT, HO, DS, CA, RI, OT,     -- outcome counts
+#                     PS, SS, C, I, DN,               -- suspect-role counts
+#                     prr, ror, ror_lower95)          -- disproportionality
+#
+# Medications are grouped by medication_index.canonical_name (strength
+# and form variants merged), side effects by side_effect_terms
+# (spelling variants merged). Counts are drug-event rows of side_effects.
+#
+# PRR / ROR compare how often a side effect is reported with this drug
+# against all other drugs (2x2 table: n11 = this drug and this side
+# effect, n10 = this drug / other side effects, n01 = other drugs / this
+# side effect, n00 = neither). The cells count distinct (report, drug,
+# side effect) triples where the drug is a suspect (PS / SS), so
+# concomitant drugs and repeated drug_seq rows do not inflate them;
+# prr / ror are NULL for drugs never reported as a suspect:
+#   PRR = (n11 / (n11 + n10)) / (n01 / (n01 + n00))
+#   ROR = (n11 * n00) / (n10 * n01), with the lower bound of its 95% CI
+#
+# Usage: python aggregates.py [db_path]
+
+import argparse
+import math
+import sqlite3
+import time
+
+import pandas as pd
+
+from context_builder import OUTCOME_CODES, ROLE_CODES
+from db import DB_PATH, connect_readwrite
+from db_queries import TABLE
+from medication_index import canonical_name
+from side_effect_terms import normalize_term
+
+
+STATS_TABLE = "side_effect_stats"
+SUSPECT_ROLES = ("PS", "SS")
+
+
+def _ror_lower95(n11: int, n10: int, n01: int, n00: int) -> float | None:
+    if not (n11 > 0 and n10 > 0 and n01 > 0 and n00 > 0):
+        return None
+    se = math.sqrt(1 / n11 + 1 / n10 + 1 / n01 + 1 / n00)
+    return math.exp(math.log(n11 * n00 / (n10 * n01)) - 1.96 * se)
+
+
+def _column_names(conn: sqlite3.Connection) -> dict:
+    return {r[1].lower(): r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")}
+
+
+# ---------------------------------------------------------
+# Build
+# ---------------------------------------------------------
+def build_stats(conn: sqlite3.Connection) -> int:
+    """
+    Rebuild side_effect_stats from side_effects. Raw names are normalized
+    once per distinct value (temp mapping tables), then SQLite does the
+    grouping. The new table replaces the old one in one transaction.
+    Returns the number of (medication, side effect) rows.
+    """
+    cols = _column_names(conn)
+    outcome = cols.get("outcome")
+    role = cols.get("drug_suspicion")
+    primaryid = cols.get("primaryid")
+
+    conn.executescript(
+        """
+        DROP TABLE IF EXISTS temp.med_map;
+        DROP TABLE IF EXISTS temp.se_map;
+        CREATE TEMP TABLE med_map (raw TEXT PRIMARY KEY, canon TEXT NOT NULL);
+        CREATE TEMP TABLE se_map (raw TEXT PRIMARY KEY, term TEXT NOT NULL);
+        """
+    )
+    meds = conn.execute(f"SELECT DISTINCT medication FROM {TABLE} WHERE medication IS NOT NULL").fetchall()
+    conn.executemany(
+        "INSERT INTO temp.med_map VALUES (?, ?)",
+        ((raw, canon) for (raw,) in meds if (canon := canonical_name(str(raw)))),
+    )
+    terms = conn.execute(f"SELECT DISTINCT side_effect FROM {TABLE} WHERE side_effect IS NOT NULL").fetchall()
+    conn.executemany(
+        "INSERT INTO temp.se_map VALUES (?, ?)",
+        ((raw, term) for (raw,) in terms if (term := normalize_term(str(raw)))),
+    )
+
+    # Cells may hold several codes ("HO,DE" / "HO DE")
+    if outcome:
+        cell = f"',' || replace(replace(replace(upper(t.\"{outcome}\"), ' ', ','), ';', ','), '/', ',') || ','"
+        outcome_sums = [f"COALESCE(SUM(instr({cell}, ',{c},') > 0), 0) AS {c}" for c in OUTCOME_CODES]
+    else:
+        outcome_sums = [f"0 AS {c}" for c in OUTCOME_CODES]
+    if role:
+        role_sums = [f"COALESCE(SUM(upper(trim(t.\"{role}\")) = '{c}'), 0) AS {c}" for c in ROLE_CODES]
+        suspect = f"upper(trim(t.\"{role}\")) IN ({', '.join(repr(r) for r in SUSPECT_ROLES)})"
+    else:
+        role_sums = [f"0 AS {c}" for c in ROLE_CODES]
+        suspect = "1"
+    # Distinct reports; rows without a primaryid (older loads) count once each
+    if primaryid:
+        suspect_reports = (
+            f"COUNT(DISTINCT CASE WHEN {suspect} THEN t.\"{primaryid}\" END) "
+            f"+ COALESCE(SUM({suspect} AND t.\"{primaryid}\" IS NULL), 0)"
+        )
+    else:
+        suspect_reports = f"COALESCE(SUM({suspect}), 0)"
+
+    code_cols = OUTCOME_CODES + ROLE_CODES
+    conn.create_function("ror_lower95", 4, _ror_lower95, deterministic=True)
+    conn.executescript(
+        f"""
+        DROP TABLE IF EXISTS temp.pair_counts;
+        CREATE TEMP TABLE pair_counts AS
+        SELECT m.canon AS medication, s.term AS side_effect, COUNT(*) AS reports,
+               {', '.join(outcome_sums + role_sums)},
+               {suspect_reports} AS suspect_reports
+        FROM {TABLE} t
+        JOIN temp.med_map m ON m.raw = t.medication
+        JOIN temp.se_map s ON s.raw = t.side_effect
+        GROUP BY m.canon, s.term;
+
+        DROP TABLE IF EXISTS {STATS_TABLE}_new;
+        CREATE TABLE {STATS_TABLE}_new (
+            medication   TEXT NOT NULL,
+            side_effect  TEXT NOT NULL,
+            reports      INTEGER NOT NULL,
+            {', '.join(f'{c} INTEGER NOT NULL' for c in code_cols)},
+            prr          REAL,
+            ror          REAL,
+            ror_lower95  REAL,
+            PRIMARY KEY (medication, side_effect)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    with conn:
+        conn.execute(
+            f"""
+            INSERT INTO {STATS_TABLE}_new
+            WITH drug AS (SELECT medication, SUM(suspect_reports) AS n FROM temp.pair_counts GROUP BY medication),
+                 event AS (SELECT side_effect, SUM(suspect_reports) AS n FROM temp.pair_counts GROUP BY side_effect),
+                 total AS (SELECT SUM(suspect_reports) AS n FROM temp.pair_counts),
+                 -- n11..n00, not a..d: identifiers are case-insensitive and
+                 -- "C" is already a role column
+                 cells AS (
+                     SELECT p.*,
+                            p.suspect_reports AS n11,
+                            drug.n - p.suspect_reports AS n10,
+                            event.n - p.suspect_reports AS n01,
+                            total.n - drug.n - event.n + p.suspect_reports AS n00
+                     FROM temp.pair_counts p
+                     JOIN drug USING (medication)
+                     JOIN event USING (side_effect), total
+                 )
+            SELECT medication, side_effect, reports, {', '.join(code_cols)},
+                   CASE WHEN n11 > 0 THEN (1.0 * n11 / (n11 + n10)) / NULLIF(1.0 * n01 / NULLIF(n01 + n00, 0), 0) END,
+                   CASE WHEN n11 > 0 THEN (1.0 * n11 * n00) / NULLIF(1.0 * n10 * n01, 0) END,
+                   ror_lower95(n11, n10, n01, n00)
+            FROM cells
+            """
+        )
+        conn.execute(f"DROP TABLE IF EXISTS {STATS_TABLE}")
+        conn.execute(f"ALTER TABLE {STATS_TABLE}_new RENAME TO {STATS_TABLE}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{STATS_TABLE}_med_reports "
+            f"ON {STATS_TABLE}(medication, reports DESC)"
+        )
+
+    conn.executescript(
+        "DROP TABLE IF EXISTS temp.pair_counts; DROP TABLE IF EXISTS temp.med_map; DROP TABLE IF EXISTS temp.se_map;"
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {STATS_TABLE}").fetchone()[0]
+
+
+# ---------------------------------------------------------
+# Read
+# ---------------------------------------------------------
+def stats_for_medication(
+    conn: sqlite3.Connection,
+    medication: str,
+    limit: int = 500
+) -> pd.DataFrame:
+    """
+    Pre-aggregated rows for one canonical medication name, most reported
+    first (one index range scan). Same columns as
+    context_builder.aggregate_side_effects, plus prr / ror / ror_lower95.
+    Empty if the medication or the stats table does not exist.
+    """
+    try:
+        return pd.read_sql_query(
+            f"SELECT * FROM {STATS_TABLE} WHERE medication = ? ORDER BY reports DESC, side_effect LIMIT ?",
+            conn,
+            params=(medication, limit),
+        ).drop(columns="medication")
+    except (sqlite3.OperationalError, pd.errors.DatabaseError):
+        return pd.DataFrame()
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the side_effect_stats aggregate table.")
+    parser.add_argument("db_path", nargs="?", default=DB_PATH)
+    args = parser.parse_args()
+
+    conn = connect_readwrite(args.db_path)
+    try:
+        start = time.perf_counter()
+        rows = build_stats(conn)
+        print(f"Built {STATS_TABLE}: {rows:,} rows in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# answer_cache.py
+#
+# Two-tier cache for final LLM answers: an in-process LRU in front of a
+# persistent SQLite store.
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from db import file_fingerprint
+
+
+CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "DrugData/answer_cache.db")
+TTL = 24 * 3600              # seconds an answer stays valid
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 10_000
+
+
+# ---------------------------------------------------------
+# Keys and versions
+# ---------------------------------------------------------
+def normalize_question(question: str) -> str:
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    return q.rstrip("?.! ")
+
+
+def make_key(model: str, system_prompt: str, context: str, question: str) -> str:
+    """
+    Cache key: model + system prompt + content hash of the built context
+    + normalized question.
+    """
+    h = hashlib.sha256()
+    for part in (model, system_prompt, context, normalize_question(question)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def data_version(docs: List[Dict]) -> str:
+    """
+    Version of everything an answer was derived from: the database's
+    file_fingerprint (the same one the derived indexes use) plus a hash
+    of each scraped page's text. An entry stored under one version is
+    never served under another.
+    """
+    pages = hashlib.sha1()
+    for d in sorted(docs, key=lambda d: d.get("url", "")):
+        pages.update(d.get("url", "").encode("utf-8"))
+        pages.update(hashlib.sha1((d.get("text") or "").encode("utf-8")).digest())
+    return json.dumps({"db": file_fingerprint(), "pages": pages.hexdigest()[:16]})
+
+
+# ---------------------------------------------------------
+# Cache
+# ---------------------------------------------------------
+class AnswerCache:
+    """
+    get() looks in memory first, then on disk (promoting disk hits into
+    memory). Entries expire after `ttl` and are dropped as soon as they
+    are looked up under a different data version. Both tiers evict
+    least-recently-used entries beyond their size bound.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = TTL,
+        memory_entries: int = MEMORY_ENTRIES,
+        disk_entries: int = DISK_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "invalidated": 0}
+
+        self._memory: OrderedDict[str, Tuple[str, str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key         TEXT PRIMARY KEY,
+                answer      TEXT NOT NULL,
+                version     TEXT NOT NULL,
+                created_at  REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers(last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, version: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                answer, entry_version, created = entry
+                if entry_version == version and now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return answer
+                self._drop_locked(key)
+                self.stats["invalidated"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            row = self._conn.execute(
+                "SELECT answer, version, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            answer, entry_version, created = row
+            if entry_version != version or now - created >= self.ttl:
+                self._drop_locked(key)
+                self.stats["invalidated"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember_locked(key, (answer, entry_version, created))
+            self.stats["disk_hits"] += 1
+            return answer
+
+    def put(self, key: str, answer: str, version: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember_locked(key, (answer, version, now))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, version, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, answer, version, now, now),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM answers WHERE key IN (
+                    SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.disk_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def _remember_locked(self, key: str, entry: Tuple[str, str, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _drop_locked(self, key: str) -> None:
+        self._memory.pop(key, None)
+        self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+        self._conn.commit()
+
+
+_cache: AnswerCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+
+    return _cache
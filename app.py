@@ -3,8 +3,13 @@
 import streamlit as st
 import pandas as pd
 
-from data_loader import load_sqlite_side_effects, load_scraped_side_effects
-from agent import answer_question
+from data_loader import build_medication_urls, load_sqlite_side_effects
+from db import DB_PATH, get_pool
+from agent import build_prompt, stream_prepared
+from pipeline import run_question_pipeline
+from medication_index import get_medication_index
+from retrieval import fetch_medication_rows, filter_df_by_medication
+from semantic_index import get_term_index
 
 
 # ---------------------------------------------------------
@@ -20,32 +25,43 @@ st.set_page_config(
 # ---------------------------------------------------------
 # Load SQLite ONLY (no scraping yet)
 # ---------------------------------------------------------
-@st.cache_data(show_spinner=True)
+# cache_resource, not cache_data: the frame's columns are memory-mapped
+# (snapshot.py) and must be shared, not copied per session
+@st.cache_resource(show_spinner=True)
 def init_sqlite():
-    db_path = "Drugdata/CapstoneRJ.db"
-    df = load_sqlite_side_effects(db_path)
+    df = load_sqlite_side_effects(DB_PATH)
     return df
 
 
-df = init_sqlite()
+# One pool of read-only connections for every session in this process
+@st.cache_resource
+def init_db_pool():
+    return get_pool()
 
 
-# ---------------------------------------------------------
-# Helper: Build URLs dynamically from medication name
-# ---------------------------------------------------------
-def build_medication_urls(med_name: str):
-    """
-    Convert a medication name into URL slugs for scraping.
-    """
-    med_slug = med_name.lower().replace(" ", "-")
+# Side-effect term index for query expansion (memory-mapped from disk
+# unless the database changed since it was built)
+@st.cache_resource(show_spinner=True)
+def init_term_index():
+    try:
+        return get_term_index()
+    except Exception:
+        return None     # expansion is skipped without it
 
-    urls = [
-        f"https://www.drugs.com/sfx/{med_slug}-side-effects.html",
-        f"https://www.mayoclinic.org/drugs-supplements/{med_slug}/side-effects",
-        f"https://medlineplus.gov/druginfo/meds/{med_slug}.html",
-    ]
 
-    return urls
+# Medication dictionary for autocomplete and name resolution
+@st.cache_resource(show_spinner=True)
+def init_medication_index():
+    try:
+        return get_medication_index()
+    except Exception:
+        return None     # names are then used as typed
+
+
+df = init_sqlite()
+init_db_pool()
+init_term_index()
+med_index = init_medication_index()
 
 
 # ---------------------------------------------------------
@@ -53,11 +69,23 @@ def build_medication_urls(med_name: str):
 # ---------------------------------------------------------
 st.sidebar.title("Medication Side Effects Explorer")
 
-med_filter = st.sidebar.text_input(
+med_input = st.sidebar.text_input(
     "Medication name (required)",
     placeholder="e.g., ondansetron",
 )
 
+# Autocomplete: the best match for what was typed (brand names,
+# strengths and typos resolved), then prefix / fuzzy suggestions
+med_filter = med_input
+if med_input.strip() and med_index is not None:
+    resolved = med_index.resolve(med_input)
+    options = [resolved.name] if resolved else []
+    options += [s for s in med_index.suggest(med_input) if s not in options]
+    if options:
+        med_filter = st.sidebar.selectbox("Matching medications", options, index=0)
+    else:
+        st.sidebar.caption("No medication with this name in the FDA data.")
+
 
 # ---------------------------------------------------------
 # Main UI
@@ -83,42 +111,48 @@ if ask_button:
 
     med_name = med_filter.strip()
 
-    # ---- 1. Query SQLite for this medication only ----
-    df_filtered = df[df["medication"].str.contains(med_name, case=False, na=False)]
+    # ---- 1. Query SQLite for this medication only (indexed lookup) ----
+    try:
+        df_filtered = fetch_medication_rows(med_name)
+    except Exception:
+        df_filtered = filter_df_by_medication(df, med_name)
 
-    # ---- 2. Scrape URLs dynamically for this medication ----
-    with st.spinner(f"Scraping data for {med_name}..."):
+    # ---- 2+3. Scrape pages and run SQL side by side, then build the prompt ----
+    with st.spinner(f"Scraping web sources and querying FDA data for {med_name}..."):
         urls = build_medication_urls(med_name)
-        docs = load_scraped_side_effects(urls)
-
-    # ---- 3. Ask the agent ----
-    with st.spinner("Thinking..."):
-        answer, csv_rows, docs_used = answer_question(
+        results = run_question_pipeline(
             df=df_filtered,
-            docs=docs,
+            urls=urls,
             question=question,
             med_filter=med_name,
+            include_answer=False,
+        )
+
+    prepared = results["context"].value
+    if prepared is None:
+        # Context stage failed or timed out: answer from whatever arrived
+        prepared = build_prompt(
+            results["sql_exec"].value, results["extract"].value, question, results["stats"].value
         )
 
-    # ---- 4. Display answer ----
-    ##st.subheader("Answer")
-    #st.write(answer)
+    answer_tokens = stream_prepared(prepared)
+    csv_rows, docs_used = prepared["csv_rows"], prepared["docs"]
+    stats = prepared.get("stats")
 
     # ---- 4. Display results in tabs ----
+    # The FDA Data and Web Sources tabs are filled first, since retrieval
+    # is already done; the Answer tab then streams tokens as they arrive.
     tab1, tab2, tab3 = st.tabs([ "Answer", "FDA Data", "Web Sources"])
 
-    # -------------------------
-    # TAB 1 — LLM Answer
-    # -------------------------
-    with tab1:
-        st.subheader("LLM Answer Sideeffects")
-        st.write(answer)
-
     # -------------------------
     # TAB 2 — FDA  Data from SQLite
     # -------------------------
     with tab2:
         st.subheader("Supporting FDA Data from SQLite ")
+        if stats is not None and not stats.empty:
+            st.markdown(f"**All reports for {med_name}, per side effect** (PRR / ROR > 1: reported more often than with other drugs)")
+            st.dataframe(stats, hide_index=True)
+            st.markdown("**Rows matching the question**")
         if not csv_rows.empty:
             st.dataframe(csv_rows.reset_index(drop=True))
 
@@ -167,10 +201,26 @@ if ask_button:
                 if d.get("side_effects"):
                     st.markdown("**Extracted side effects:** " + ", ".join(d["side_effects"]))
                 excerpt = (d.get("text") or "")[:500]
-            if excerpt:
-                st.markdown("**Excerpt:**")
-                st.write(excerpt + "...")
-            st.markdown("---")
+                if excerpt:
+                    st.markdown("**Excerpt:**")
+                    st.write(excerpt + "...")
+                st.markdown("---")
+
+
+    # -------------------------
+    # TAB 1 — LLM Answer (streamed)
+    # -------------------------
+    with tab1:
+        st.subheader("LLM Answer Sideeffects")
+        answer = st.write_stream(answer_tokens)
+
+        packing = prepared.get("packing")
+        if packing and packing["dropped"]:
+            dropped = ", ".join(f"{n} {kind}" for kind, n in packing["dropped"].items())
+            st.caption(
+                f"Context: {packing['used']}/{packing['budget']} tokens; "
+                f"left out as less relevant: {dropped}"
+            )
 
 
     # ---- 5. Sources toggle ----
@@ -1,6 +1,7 @@
 # async_utils.py
 
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 def run_async(coro):
     """
@@ -13,7 +14,9 @@ def run_async(coro):
         asyncio.set_event_loop(loop)
 
     if loop.is_running():
-        # Streamlit sometimes runs inside an event loop
-        return asyncio.run(coro)
+        # Streamlit sometimes runs inside an event loop, and asyncio.run()
+        # cannot nest -- drive the coroutine on a short-lived worker thread.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coro).result()
     else:
         return loop.run_until_complete(coro)
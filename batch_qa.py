@@ -0,0 +1,297 @@
+# batch_qa.py
+#
+# Answer a file of questions without the Streamlit UI.
+#
+# Input is JSONL, one record per line:
+#   {"medication": "ondansetron", "question": "Does it cause headaches?"}
+#   (optional "id"; otherwise one is derived from medication + question)
+#
+# Questions are grouped by (resolved) medication, so the web pages, the
+# medication's rows and its pre-aggregated statistics are fetched once
+# per drug. Each question then runs the same steps as
+# agent.answer_question (SQL generation, retrieval, prompt, answer) on a
+# thread pool of --concurrency workers. LLM calls go through the shared
+# client in llm_client.py, whose request limit --rpm sets.
+#
+# Medication names are resolved only when they match a dictionary name,
+# brand name or strength variant ("match": "exact" / "alias"). A
+# misspelled name is used as given; its closest dictionary name is
+# reported as "suggestion", never silently substituted.
+#
+# Results are appended to the output JSONL as they finish, one line per
+# question with its answer and per-step timings. Re-running with the
+# same output file skips questions already answered successfully, so an
+# interrupted batch resumes where it stopped.
+#
+# Usage:
+#   python batch_qa.py questions.jsonl -o answers.jsonl [--concurrency 4] [--rpm 500]
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, NamedTuple
+
+import pandas as pd
+
+from agent import SYSTEM_PROMPT, build_prompt, fetch_stats, format_llm_error, generate_sql, retrieve_rows
+from data_loader import build_docs, build_medication_urls, fetch_pages
+from llm_client import LLM_RPM, LLMError, call_llm, get_client
+from retrieval import RESOLVED_MATCHES, fetch_medication_rows, match_medication, resolve_medication
+
+
+DEFAULT_CONCURRENCY = 4
+PREPARE_WORKERS = 2       # medications scraped / queried at the same time
+
+
+class Item(NamedTuple):
+    id: str
+    medication: str       # as given in the input
+    question: str
+
+
+class MedicationData(NamedTuple):
+    name: str             # resolved medication name
+    rows: pd.DataFrame
+    docs: List[Dict]
+    stats: pd.DataFrame | None
+    seconds: float
+
+
+# ---------------------------------------------------------
+# Input / output
+# ---------------------------------------------------------
+def item_id(medication: str, question: str) -> str:
+    text = f"{medication.strip().lower()}\n{' '.join(question.split())}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def read_items(path: str) -> List[Item]:
+    """
+    Records of the input JSONL. Blank lines are ignored; records without
+    a medication or question are reported and skipped.
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            medication = str(rec.get("medication") or "").strip()
+            question = str(rec.get("question") or "").strip()
+            if not medication or not question:
+                print(f"{path}:{line_no}: skipped, needs 'medication' and 'question'", file=sys.stderr)
+                continue
+            items.append(Item(str(rec.get("id") or item_id(medication, question)), medication, question))
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """
+    IDs already answered successfully in an earlier run. A line cut off
+    by an interruption is ignored (its question runs again).
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("status") == "ok":
+                done.add(rec.get("id"))
+    return done
+
+
+def resolution_fields(medication: str) -> Dict:
+    """
+    How the input name was resolved, for the output record: "match" is
+    "exact" / "alias", or None if the name is used as given. A fuzzy
+    dictionary hit is not applied, only reported as "suggestion".
+    """
+    match = match_medication(medication)
+    if match is None:
+        return {"match": None}
+    if match.match in RESOLVED_MATCHES:
+        return {"match": match.match}
+    return {"match": None, "suggestion": match.name}
+
+
+def group_by_medication(items: List[Item]) -> Dict[str, List[Item]]:
+    """
+    Items keyed by resolved medication name, in input order.
+    """
+    resolved: Dict[str, str] = {}
+    groups: Dict[str, List[Item]] = {}
+    for item in items:
+        key = item.medication.lower()
+        if key not in resolved:
+            resolved[key] = resolve_medication(item.medication)
+            suggestion = resolution_fields(item.medication).get("suggestion")
+            if suggestion:
+                print(f"{item.medication}: not in the FDA data (did you mean {suggestion}?), used as given",
+                      file=sys.stderr)
+        groups.setdefault(resolved[key], []).append(item)
+    return groups
+
+
+# ---------------------------------------------------------
+# Work
+# ---------------------------------------------------------
+def prepare_medication(name: str) -> MedicationData:
+    """
+    Everything shared by the questions about one drug.
+    """
+    start = time.perf_counter()
+    try:
+        rows = fetch_medication_rows(name)
+    except Exception:
+        rows = pd.DataFrame()
+    docs = build_docs(fetch_pages(build_medication_urls(name)))
+    stats = fetch_stats(name)
+    return MedicationData(name, rows, docs, stats, time.perf_counter() - start)
+
+
+def answer_prepared(prepared: Dict) -> str:
+    """
+    The answer for a prompt from agent.build_prompt; raises LLMError
+    (unlike agent.answer_prepared, which turns it into text).
+    """
+    return call_llm(
+        system_prompt=SYSTEM_PROMPT,
+        messages=prepared["messages"],
+        cache_key=prepared["cache_key"],
+        cache_version=prepared["cache_version"],
+    )
+
+
+def answer_item(item: Item, med: MedicationData) -> Dict:
+    """
+    Answer one question (the steps of agent.answer_question, timed).
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+
+    def step(name: str, fn, *args):
+        t0 = time.perf_counter()
+        value = fn(*args)
+        timings[name] = round(time.perf_counter() - t0, 3)
+        return value
+
+    record = {"id": item.id, "medication": item.medication, "resolved": med.name,
+              **resolution_fields(item.medication), "question": item.question}
+    try:
+        sql = step("sql_gen", generate_sql, item.question, med.name)
+        rows = step("retrieve", retrieve_rows, med.rows, item.question, med.name, sql)
+        prepared = step("prompt", build_prompt, rows, med.docs, item.question, med.stats)
+        record.update(rows=len(rows), docs=sum(1 for d in med.docs if not d.get("error")))
+
+        answer = step("answer", answer_prepared, prepared)
+        record.update(status="ok", answer=answer, error=None)
+    except LLMError as e:
+        record.update(status="error", answer=None, error=format_llm_error(e))
+    except Exception as e:
+        record.update(status="error", answer=None, error=f"{type(e).__name__}: {e}")
+
+    timings["medication_prep"] = round(med.seconds, 3)
+    timings["total"] = round(time.perf_counter() - start, 3)
+    record["timings"] = timings
+    return record
+
+
+def run_batch(
+    items: List[Item],
+    output: str,
+    concurrency: int = DEFAULT_CONCURRENCY
+) -> Dict[str, int]:
+    """
+    Answer every item not already completed in `output`, appending one
+    JSON line per item as it finishes. Returns {"ok", "error", "skipped"}.
+    """
+    done = completed_ids(output)
+    todo = [item for item in items if item.id not in done]
+    counts = {"ok": 0, "error": 0, "skipped": len(items) - len(todo)}
+    if not todo:
+        return counts
+
+    groups = group_by_medication(todo)
+
+    prep_pool = ThreadPoolExecutor(max_workers=PREPARE_WORKERS, thread_name_prefix="prepare")
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="question")
+    preparing: Dict[Future, str] = {prep_pool.submit(prepare_medication, name): name for name in groups}
+    answering: set = set()
+
+    start = time.perf_counter()
+    try:
+        with open(output, "a", encoding="utf-8") as out:
+            while preparing or answering:
+                finished, _ = wait(set(preparing) | answering, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    if fut in preparing:
+                        name = preparing.pop(fut)
+                        try:
+                            med = fut.result()
+                        except Exception as e:
+                            # Scraping / DB failed for the whole drug: answer from nothing
+                            print(f"{name}: preparation failed ({e})", file=sys.stderr)
+                            med = MedicationData(name, pd.DataFrame(), [], None, 0.0)
+                        for item in groups[name]:
+                            answering.add(pool.submit(answer_item, item, med))
+                        continue
+
+                    answering.discard(fut)
+                    record = fut.result()
+                    record["finished_at"] = time.time()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+
+                    counts[record["status"]] += 1
+                    n = counts["ok"] + counts["error"]
+                    elapsed = time.perf_counter() - start
+                    print(f"[{n}/{len(todo)}] {record['status']:5} {record['timings']['total']:6.1f}s "
+                          f"{record['resolved']}: {record['question'][:60]} ({n / elapsed:.2f} q/s)")
+    finally:
+        # On Ctrl+C: drop queued work; finished lines are already on disk
+        prep_pool.shutdown(wait=False, cancel_futures=True)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return counts
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of medication questions.")
+    parser.add_argument("input", help="JSONL with 'medication' and 'question' per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL to append results to (also the resume log)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"questions answered at the same time (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--rpm", type=float, default=LLM_RPM,
+                        help=f"max LLM requests per minute, 0 = unlimited (default $LLM_RPM or {LLM_RPM})")
+    args = parser.parse_args()
+
+    try:
+        get_client().set_limits(rpm=args.rpm)
+    except LLMError as e:
+        sys.exit(f"LLM backend unavailable: {e}")
+
+    items = read_items(args.input)
+    start = time.perf_counter()
+    try:
+        counts = run_batch(items, args.output, args.concurrency)
+    except KeyboardInterrupt:
+        print("Interrupted; run again with the same --output to resume.", file=sys.stderr)
+        sys.exit(130)
+
+    print(f"Done in {time.perf_counter() - start:.1f}s: {counts['ok']} ok, "
+          f"{counts['error']} failed, {counts['skipped']} already answered")
+
+
+if __name__ == "__main__":
+    main()
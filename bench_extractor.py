@@ -0,0 +1,99 @@
+# bench_extractor.py
+#
+# Parse-time benchmark for extractor.extract_side_effects.
+#
+#   python bench_extractor.py                 # synthetic label pages
+#   python bench_extractor.py page1.html ...  # saved real pages
+#
+# "before" re-implements the original pipeline (html.parser tree per
+# extractor + lazy DOTALL regexes over the raw HTML); "after" is the
+# current single-parse, rule-driven extractor.
+
+import re
+import sys
+import time
+from typing import Callable, List
+
+from bs4 import BeautifulSoup
+
+from domain_extractors import PARSER
+from extractor import extract_side_effects
+
+
+URL = "https://example.org/label.html"   # no domain rule -> general extractor
+
+
+def legacy_extract_general(html: str) -> List[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    results = set()
+
+    for h in soup.find_all(["h1", "h2", "h3", "h4"]):
+        text = h.get_text(" ", strip=True).lower()
+        if "side effects" in text or "adverse reactions" in text or "side-effects" in text:
+            sib = h.find_next_sibling()
+            while sib and sib.name in ["p", "ul", "ol"]:
+                if sib.name in ["ul", "ol"]:
+                    for li in sib.find_all("li"):
+                        results.add(li.get_text(" ", strip=True))
+                elif sib.name == "p":
+                    for part in re.split(r"[;,]", sib.get_text(" ", strip=True)):
+                        if 0 < len(part.split()) <= 6:
+                            results.add(part.strip())
+                sib = sib.find_next_sibling()
+
+    patterns = [
+        r"common side effects include[:\-]?\s*(.*?)(?:\.|\n)",
+        r"side effects may include[:\-]?\s*(.*?)(?:\.|\n)",
+        r"may cause[:\-]?\s*(.*?)(?:\.|\n)",
+    ]
+    for pattern in patterns:
+        for m in re.findall(pattern, html, flags=re.IGNORECASE | re.DOTALL):
+            for item in re.split(r"[;,]", m):
+                if item.strip():
+                    results.add(item.strip())
+
+    return sorted(results)
+
+
+def synthetic_page(sections: int = 200) -> str:
+    head = "<head>" + "<script>var x = 'may cause' + 1;</script>" * 50 + "</head>"
+    filler = "".join(
+        f"<h3>Section {i}</h3><p>Paragraph {i} about dosing, storage and interactions.</p>"
+        f"<div class='nav'><a href='/x/{i}'>link {i}</a></div>"
+        for i in range(sections)
+    )
+    se = (
+        "<h2>Side effects</h2>"
+        "<p>Common side effects include headache, nausea, dizziness.</p>"
+        "<ul>" + "".join(f"<li>effect {i}</li>" for i in range(40)) + "</ul>"
+    )
+    return f"<html>{head}<body>{filler}{se}{filler}</body></html>"
+
+
+def time_per_page(fn: Callable[[str], List[str]], pages: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            fn(html)
+    return (time.perf_counter() - start) / (repeat * len(pages)) * 1000
+
+
+def main(paths: List[str]) -> None:
+    if paths:
+        pages = [open(p, encoding="utf-8", errors="replace").read() for p in paths]
+    else:
+        pages = [synthetic_page(n) for n in (50, 200, 800)]
+
+    repeat = 5
+    before = time_per_page(legacy_extract_general, pages, repeat)
+    after = time_per_page(lambda html: extract_side_effects(URL, html), pages, repeat)
+
+    size_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"pages: {len(pages)}  avg size: {size_kb:.0f} KiB  parser: {PARSER}")
+    print(f"before (html.parser + raw-HTML regex): {before:8.2f} ms/page")
+    print(f"after  (single parse + section regex): {after:8.2f} ms/page")
+    print(f"speed-up: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
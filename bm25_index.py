@@ -0,0 +1,92 @@
+# bm25_index.py
+#
+# Small in-memory inverted index with Okapi BM25 scoring. Documents are
+# added incrementally; a query only touches the postings of its own terms
+# and the top k are taken with a heap.
+
+import heapq
+import math
+import threading
+from collections import Counter
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+K1 = 1.2
+B = 0.75
+
+
+class BM25Index:
+    """
+    Documents are token lists under a hashable key. Adding an existing
+    key is a no-op, so callers can re-add everything they see and only
+    new documents are indexed.
+    """
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._lengths
+
+    def add(self, key: Hashable, tokens: Iterable[str]) -> bool:
+        """
+        Index a document. Returns False if the key was already indexed.
+        """
+        with self._lock:
+            if key in self._lengths:
+                return False
+            tf = Counter(tokens)
+            for term, n in tf.items():
+                self._postings.setdefault(term, {})[key] = n
+            length = sum(tf.values())
+            self._lengths[key] = length
+            self._total_length += length
+            return True
+
+    def scores(
+        self,
+        terms: Iterable[str],
+        allow: Callable[[Hashable], bool] | None = None,
+    ) -> Dict[Hashable, float]:
+        """
+        BM25 score of every document containing at least one query term
+        (optionally restricted to keys for which `allow` is true).
+        """
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return {}
+            avg_len = self._total_length / n_docs or 1.0
+
+            scores: Dict[Hashable, float] = {}
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    if allow is not None and not allow(key):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[key] / avg_len)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return scores
+
+    def search(
+        self,
+        terms: Iterable[str],
+        top_k: int = 10,
+        allow: Callable[[Hashable], bool] | None = None,
+    ) -> List[Tuple[float, Hashable]]:
+        """
+        Top k (score, key) pairs, best first.
+        """
+        scores = self.scores(terms, allow)
+        return heapq.nlargest(top_k, ((s, k) for k, s in scores.items()), key=lambda x: x[0])
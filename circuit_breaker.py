@@ -0,0 +1,90 @@
+# circuit_breaker.py
+
+import threading
+import time
+from typing import Dict
+
+
+FAILURE_THRESHOLD = 3     # consecutive failures before a domain is skipped
+RESET_TIMEOUT = 300       # seconds before an open circuit lets a probe through
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a domain whose circuit is open."""
+
+
+# ---------------------------------------------------------
+# Per-domain circuit breaker
+# ---------------------------------------------------------
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    closed    -> calls pass; consecutive failures are counted.
+    open      -> calls are refused until `reset_timeout` has elapsed
+                 (or the server's Retry-After, see record_failure).
+    half_open -> exactly one probe call is let through; success closes
+                 the circuit, failure re-opens it for another timeout.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.reopen_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            if self.state == "open" and time.monotonic() >= self.reopen_at:
+                # Let a single probe through; everyone else keeps waiting.
+                self.state = "half_open"
+                return True
+
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self, retry_after: float | None = None) -> None:
+        """
+        Count a failure. With `retry_after` (the server asked us to back
+        off, e.g. 429) the circuit opens at once for that many seconds.
+        """
+        with self._lock:
+            self.failures += 1
+            now = time.monotonic()
+            if retry_after is not None:
+                self.state = "open"
+                self.opened_at = now
+                self.reopen_at = now + retry_after
+            elif self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = now
+                self.reopen_at = now + self.reset_timeout
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(domain: str) -> CircuitBreaker:
+    """
+    Return the process-wide breaker for a domain.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(domain)
+        if breaker is None:
+            breaker = _breakers[domain] = CircuitBreaker()
+        return breaker
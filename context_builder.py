@@ -0,0 +1,166 @@
+# context_builder.py
+#
+# Vectorized summaries of FAERS rows for the LLM context: one line per
+# side effect with report counts and outcome / suspect-role breakdowns,
+# instead of one line per raw report. Side effects are grouped by their
+# interned term ID (side_effect_terms), so spelling variants merge.
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from side_effect_terms import get_interner
+
+
+OUTCOME_CODES = ["DE", "LT", "HO", "DS", "CA", "RI", "OT"]
+ROLE_CODES = ["PS", "SS", "C", "I", "DN"]
+
+FDA_SOURCE = "FDA Data from SQLite"
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series | None:
+    # Tables use both "outcome" and "Outcome"
+    for col in df.columns:
+        if col.lower() == name:
+            return df[col]
+    return None
+
+
+def _code_counts(values: pd.Series, keys: np.ndarray, codes: List[str]) -> pd.DataFrame:
+    """
+    Per-key counts of each code. A cell may hold several codes
+    ("HO,DE" / "HO DE"); each is counted once.
+    """
+    # Parse each distinct cell once, then count (key, cell) pairs
+    cell_codes, cells = pd.factorize(values, sort=False)
+    cells = np.append(np.asarray(cells, dtype=object).astype(str), "")     # last cell = missing
+    cell_codes = np.where(cell_codes < 0, len(cells) - 1, cell_codes)
+    cleaned = pd.Series(cells, dtype=str).str.upper().str.replace(r"[\s;/]+", ",", regex=True)
+    dummies = cleaned.str.get_dummies(sep=",").reindex(columns=codes, fill_value=0).to_numpy()
+
+    key_codes, key_values = pd.factorize(keys, sort=False)
+    pairs = np.bincount(
+        key_codes * len(cells) + cell_codes, minlength=len(key_values) * len(cells)
+    ).reshape(len(key_values), len(cells))
+    return pd.DataFrame(pairs @ dummies, index=key_values, columns=codes)
+
+
+def side_effect_ids(df: pd.DataFrame) -> np.ndarray:
+    """
+    Interned term ID of each row's side_effect (-1 if empty).
+    """
+    return get_interner().intern_many(df["side_effect"])
+
+
+# ---------------------------------------------------------
+# Aggregation
+# ---------------------------------------------------------
+def aggregate_side_effects(csv_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Group rows by normalized side effect.
+    Returns one row per side effect, most reported first:
+        side_effect, reports, DE, LT, HO, ..., PS, SS, C, I, DN
+    (outcome and role columns only when the source columns exist).
+    """
+    if csv_rows.empty or "side_effect" not in csv_rows.columns:
+        return pd.DataFrame(columns=["side_effect", "reports"])
+
+    interner = get_interner()
+    ids = side_effect_ids(csv_rows)
+    keep = ids >= 0
+    ids = ids[keep]
+
+    present = np.flatnonzero(np.bincount(ids, minlength=len(interner)))
+    agg = pd.DataFrame(
+        {
+            "side_effect": [interner.term(i) for i in present],
+            "reports": np.bincount(ids)[present],
+        },
+        index=present,
+    )
+
+    outcome = _column(csv_rows, "outcome")
+    if outcome is not None:
+        agg = agg.join(_code_counts(outcome[keep], ids, OUTCOME_CODES))
+
+    role = _column(csv_rows, "drug_suspicion")
+    if role is not None:
+        agg = agg.join(_code_counts(role[keep], ids, ROLE_CODES))
+
+    return agg.sort_values(["reports", "side_effect"], ascending=[False, True]).reset_index(drop=True)
+
+
+def format_frequency_table(agg: pd.DataFrame, limit: int | None = None) -> List[str]:
+    """
+    One compact line per side effect, e.g.
+        - nausea: 42 reports | outcomes: HO 10, DE 1 | roles: PS 30, SS 12 | PRR 2.1, ROR 2.3
+    (PRR / ROR only for pre-aggregated rows from aggregates.py).
+    """
+    if limit is not None:
+        agg = agg.head(limit)
+
+    outcome_cols = [c for c in OUTCOME_CODES if c in agg.columns]
+    role_cols = [c for c in ROLE_CODES if c in agg.columns]
+
+    def breakdown(rec: Dict, cols: List[str]) -> str:
+        return ", ".join(f"{c} {int(rec[c])}" for c in cols if rec[c])
+
+    lines = []
+    for rec in agg.to_dict("records"):
+        parts = [f"- {rec['side_effect']}: {int(rec['reports'])} reports"]
+        outcomes = breakdown(rec, outcome_cols)
+        if outcomes:
+            parts.append(f"outcomes: {outcomes}")
+        roles = breakdown(rec, role_cols)
+        if roles:
+            parts.append(f"roles: {roles}")
+        if pd.notna(rec.get("prr")) and pd.notna(rec.get("ror")):
+            parts.append(f"PRR {rec['prr']:.1f}, ROR {rec['ror']:.1f}")
+        lines.append(" | ".join(parts))
+
+    return lines
+
+
+# ---------------------------------------------------------
+# Source map
+# ---------------------------------------------------------
+def build_source_map(csv_rows: pd.DataFrame, docs: List[Dict]) -> Dict[str, List[str]]:
+    """
+    Normalized side effect -> distinct sources, FDA first, then web
+    domains in document order. Keyed internally by term ID, so
+    "Headache" (FDA) and "headaches" (drugs.com) are one entry.
+    """
+    interner = get_interner()
+    by_id: Dict[int, List[str]] = {}
+
+    if not csv_rows.empty and "side_effect" in csv_rows.columns:
+        ids = side_effect_ids(csv_rows)
+        for term_id in pd.unique(ids[ids >= 0]):
+            by_id[int(term_id)] = [FDA_SOURCE]
+
+    for d in docs:
+        url = d.get("url", "")
+        domain = url.split("/")[2] if "://" in url else url
+        for se in d.get("side_effects", []):
+            term_id = interner.intern(se)
+            if term_id < 0:
+                continue
+            sources = by_id.setdefault(term_id, [])
+            if domain not in sources:
+                sources.append(domain)
+
+    return {interner.term(i): sources for i, sources in by_id.items()}
+
+
+def unique_terms(side_effects: List[str]) -> List[str]:
+    """
+    Normalized terms of a list of side effects, each once, in order.
+    """
+    interner = get_interner()
+    seen: Dict[int, None] = {}
+    for se in side_effects:
+        term_id = interner.intern(se)
+        if term_id >= 0:
+            seen.setdefault(term_id, None)
+    return [interner.term(i) for i in seen]
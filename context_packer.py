@@ -0,0 +1,102 @@
+# context_packer.py
+#
+# Fits LLM context into a token budget: candidate items are ranked by
+# relevance to the question and packed greedily until the budget is used.
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
+
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+TOKENIZER_ENCODING = "o200k_base"     # gpt-4.1 / gpt-4o family
+
+
+# ---------------------------------------------------------
+# Token counting
+# ---------------------------------------------------------
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # tiktoken missing, or its BPE file cannot be loaded offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with the model's tokenizer when tiktoken is available,
+    otherwise a close local estimate (words + punctuation, long words
+    split every 4 characters).
+    """
+    enc = _encoder()
+    if enc is not None:
+        return len(enc.encode(text))
+
+    count = 0
+    for piece in re.findall(r"\w+|[^\w\s]", text):
+        count += max(1, (len(piece) + 3) // 4) if piece[0].isalnum() else 1
+    return count
+
+
+# ---------------------------------------------------------
+# Packing
+# ---------------------------------------------------------
+class ContextItem(NamedTuple):
+    section: str      # where the item is rendered, e.g. "source_map"
+    text: str
+    score: float      # higher = more useful for this question
+    order: int        # original position, used to render kept items
+
+
+def relevance(text: str, terms: List[str]) -> float:
+    """
+    Share of query terms that occur in `text` (prefix match, so
+    "headache" matches "headaches").
+    """
+    if not terms:
+        return 0.0
+    words = set(re.findall(r"[a-z0-9]+", text.lower()))
+    hits = sum(1 for t in terms if any(w.startswith(t) or (len(w) > 3 and t.startswith(w)) for w in words))
+    return hits / len(terms)
+
+
+def pack(
+    items: List[ContextItem],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    reserved: int = 0,
+) -> Tuple[List[ContextItem], Dict]:
+    """
+    Greedily keep the highest-scoring items that still fit in
+    `budget - reserved` tokens. Kept items come back in their original
+    order. The report says what was used and dropped:
+        {
+          "budget": int,
+          "used": int,
+          "kept": int,
+          "dropped": {section: count}
+        }
+    """
+    remaining = budget - reserved
+    kept: List[ContextItem] = []
+    dropped: Dict[str, int] = {}
+
+    for item in sorted(items, key=lambda i: (-i.score, i.order)):
+        cost = count_tokens(item.text) + 1      # + newline
+        if cost <= remaining:
+            kept.append(item)
+            remaining -= cost
+        else:
+            dropped[item.section] = dropped.get(item.section, 0) + 1
+
+    kept.sort(key=lambda i: i.order)
+    report = {
+        "budget": budget,
+        "used": budget - remaining,
+        "kept": len(kept),
+        "dropped": dropped,
+    }
+    return kept, report
@@ -1,11 +1,18 @@
 # data_loader.py
 
-import sqlite3
+import hashlib
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from scraper import fetch_html
-from extractor import extract_side_effects
+from async_utils import run_async
+from db import connect_readonly
+from scraper import fetch_many
+from snapshot import REQUIRED_COLUMNS, clean_chunk, load_snapshot
+from domain_extractors import parse_html
+from extractor import extract_section_blocks, extract_section_text, extract_side_effects
+
+PASSAGE_CHARS = 500        # target passage size
+MAX_PASSAGES_PER_DOC = 40
 
 
 # ---------------------------------------------------------
@@ -19,87 +26,179 @@ def load_sqlite_side_effects(
     Load medication side‑effect data from a SQLite database table.
     Expected columns:
         medication, side_effect, severity, frequency, notes
+
+    The table is read through its columnar snapshot (snapshot.py):
+    memory-mapped, dictionary-encoded columns shared by all workers,
+    exported again only when the database file changes. If the snapshot
+    cannot be written, the table is read into memory directly.
     """
+    try:
+        return load_snapshot(db_path, table_name)
+    except ValueError:
+        raise
+    except OSError:
+        pass
 
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect_readonly(db_path)
     except Exception as e:
         raise RuntimeError(f"Failed to connect to SQLite database: {e}")
 
     try:
-        df = pd.read_sql_query(f"SELECT * FROM {table_name} where 1=2 ", conn)
+        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
     except Exception as e:
         raise RuntimeError(f"Failed to load table '{table_name}': {e}")
     finally:
         conn.close()
 
-    # Normalize column names
-    df.columns = [c.strip().lower() for c in df.columns]
+    df = clean_chunk(df)
 
     # Required columns
-    required = {"medication", "side_effect"}
-    missing = required - set(df.columns)
+    missing = set(REQUIRED_COLUMNS) - set(df.columns)
     if missing:
         raise ValueError(
             f"Missing required columns in SQLite table: {missing}. "
             "Ensure your table contains at least 'medication' and 'side_effect'."
         )
 
-    # Clean values
-    df["medication"] = df["medication"].astype(str).str.strip().str.lower()
-    df["side_effect"] = df["side_effect"].astype(str).str.strip()
-
-    for col in ["drug_manufacturer", "drug_suspicion", "outcome"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.strip()
-
-    df = df.dropna(subset=["medication", "side_effect"])
+    df = df.dropna(subset=list(REQUIRED_COLUMNS))
 
     return df
 
 
 # ---------------------------------------------------------
-# Scrape URLs dynamically
+# Split page text into passages
 # ---------------------------------------------------------
-def load_scraped_side_effects(urls: List[str]) -> List[Dict]:
+def split_passages(
+    url: str,
+    sections: List[Tuple[str, List[str]]],
+    max_chars: int = PASSAGE_CHARS,
+) -> List[Dict]:
     """
-    Fetch and extract side effect info from a list of URLs.
-    Returns a list of documents:
+    Split a page's (heading, blocks) sections into passages of roughly
+    `max_chars` characters. Blocks (paragraphs / list items) are never cut,
+    and a passage never spans two sections.
+
+    Each passage gets a stable ID derived from the URL, the section
+    (position + heading) and its position in that section, so the same
+    page always yields the same IDs:
         {
+          "id": str,
           "url": str,
-          "text": str,
-          "side_effects": list[str],
-          "error": str | None
+          "heading": str,
+          "text": str
         }
     """
+    passages: List[Dict] = []
+
+    for s_idx, (heading, blocks) in enumerate(sections):
+        chunks: List[str] = []
+        current: List[str] = []
+        size = 0
+
+        for block in blocks:
+            if current and size + len(block) > max_chars:
+                chunks.append("; ".join(current))
+                current, size = [], 0
+            current.append(block)
+            size += len(block) + 2
+        if current:
+            chunks.append("; ".join(current))
+
+        for i, chunk in enumerate(chunks):
+            key = f"{url}#{s_idx}:{heading}#{i}".encode("utf-8")
+            passages.append({
+                "id": hashlib.sha1(key).hexdigest()[:12],
+                "url": url,
+                "heading": heading,
+                "text": chunk,
+            })
+
+            if len(passages) >= MAX_PASSAGES_PER_DOC:
+                return passages
+
+    return passages
+
+
+# ---------------------------------------------------------
+# Build URLs dynamically from medication name
+# ---------------------------------------------------------
+def build_medication_urls(med_name: str) -> List[str]:
+    """
+    Convert a medication name into URL slugs for scraping.
+    """
+    med_slug = med_name.lower().replace(" ", "-")
+
+    urls = [
+        f"https://www.drugs.com/sfx/{med_slug}-side-effects.html",
+        f"https://www.mayoclinic.org/drugs-supplements/{med_slug}/side-effects",
+        f"https://medlineplus.gov/druginfo/meds/{med_slug}.html",
+    ]
+
+    return urls
+
+
+# ---------------------------------------------------------
+# Scrape URLs dynamically
+# ---------------------------------------------------------
+def fetch_pages(urls: List[str]) -> Dict[str, str | Exception]:
+    """
+    Fetch all URLs in parallel: {url: html or Exception}, in `urls` order.
+    Streaming stops each download once the side-effects section is in.
+    """
+    return run_async(fetch_many(urls, stream=True))
 
+
+def build_docs(pages: Dict[str, str | Exception]) -> List[Dict]:
+    """
+    Turn fetched pages into documents (see load_scraped_side_effects).
+    """
     docs: List[Dict] = []
 
-    for url in urls:
-        try:
-            html = fetch_html(url)
-        except Exception as e:
+    for url, html in pages.items():
+        if isinstance(html, Exception):
             docs.append({
                 "url": url,
                 "text": "",
                 "side_effects": [],
-                "error": str(e),
+                "passages": [],
+                "error": str(html),
             })
             continue
 
+        # Parse once; both extractors share the tree
+        soup = parse_html(html)
+
         # Extract side effects using domain-specific rules
-        side_effects = extract_side_effects(url, html)
+        side_effects = extract_side_effects(url, soup)
+
+        # Visible text of the side-effects section for context (limit size)
+        clean_text = extract_section_text(url, soup, limit=4000)
 
-        # Clean text for context (limit size)
-        clean_text = html.replace("\r", " ").replace("\n", " ")
-        if len(clean_text) > 4000:
-            clean_text = clean_text[:4000]
+        # Section-aware passages for relevance-ranked retrieval
+        passages = split_passages(url, extract_section_blocks(url, soup))
 
         docs.append({
             "url": url,
             "text": clean_text,
             "side_effects": side_effects,
+            "passages": passages,
             "error": None,
         })
 
     return docs
+
+
+def load_scraped_side_effects(urls: List[str]) -> List[Dict]:
+    """
+    Fetch and extract side effect info from a list of URLs.
+    Returns a list of documents:
+        {
+          "url": str,
+          "text": str,
+          "side_effects": list[str],
+          "passages": list[dict],   # see split_passages
+          "error": str | None
+        }
+    """
+    return build_docs(fetch_pages(urls))
@@ -0,0 +1,163 @@
+# db.py
+#
+# Single place that knows where CapstoneRJ.db lives and how to open it.
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
+DEFAULT_DB_PATH = "DrugData/CapstoneRJ.db"
+
+POOL_SIZE = 4
+MMAP_SIZE = 256 * 1024 * 1024      # bytes of the DB file mapped into memory
+CACHE_SIZE_KIB = 64 * 1024         # page cache per connection (PRAGMA cache_size=-N)
+
+
+# ---------------------------------------------------------
+# Path resolution
+# ---------------------------------------------------------
+def resolve_db_path(path: str | None = None) -> str:
+    """
+    Resolve the database path once for the whole app.
+
+    Order: explicit argument, $CAPSTONE_DB_PATH, then DEFAULT_DB_PATH.
+    The directory name is matched case-insensitively, because the repo
+    has used both "DrugData" and "Drugdata" and Linux filesystems care.
+    """
+    candidate = Path(path or os.getenv("CAPSTONE_DB_PATH") or DEFAULT_DB_PATH)
+    if candidate.exists():
+        return str(candidate)
+
+    parent = candidate.parent
+    if parent.parent.exists():
+        for entry in parent.parent.iterdir():
+            if entry.name.lower() == parent.name.lower() and (entry / candidate.name).exists():
+                return str(entry / candidate.name)
+
+    return str(candidate)
+
+
+DB_PATH = resolve_db_path()
+
+
+def file_fingerprint(path: str = DB_PATH) -> str:
+    """
+    Path + mtime + size of the database file. Indexes derived from the
+    database store it and are rebuilt when it changes.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "no-db"
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+# ---------------------------------------------------------
+# Connections
+# ---------------------------------------------------------
+def connect_readonly(path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Open a tuned read-only connection (URI mode=ro, query_only, mmap).
+    Raises sqlite3.OperationalError if the file does not exist instead
+    of silently creating an empty database.
+    """
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def connect_readwrite(path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Writable connection for migrations and ingestion.
+    """
+    return sqlite3.connect(path)
+
+
+class ReadOnlyPool:
+    """
+    Fixed-size pool of read-only connections shared across threads
+    (Streamlit runs every session on its own thread).
+
+    Each connection keeps its page cache and statement cache warm
+    between questions. sqlite3 caches prepared statements per
+    connection (`cached_statements`), so parameterized queries are
+    compiled once per pooled connection, not once per question.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                conn = connect_readonly(self.path)
+                self._created += 1
+                return conn
+
+        return self._idle.get()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool: ReadOnlyPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ReadOnlyPool:
+    """
+    Process-wide pool. app.py wraps this in st.cache_resource so all
+    Streamlit sessions share it.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReadOnlyPool()
+
+    return _pool
+
+
+@contextmanager
+def read_connection() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled read-only connection:
+
+        with read_connection() as conn:
+            ...
+    """
+    with get_pool().connection() as conn:
+        yield conn
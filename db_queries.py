@@ -0,0 +1,274 @@
+# db_queries.py
+#
+# Indexed, parameterized queries over the side_effects table.
+#
+# Run the migration once after (re)loading the database:
+#   python db_queries.py migrate DrugData/CapstoneRJ.db
+
+import argparse
+import re
+import sqlite3
+import time
+from typing import List
+
+import pandas as pd
+
+from db import DB_PATH, connect_readwrite
+
+
+TABLE = "side_effects"
+FTS_TABLE = "side_effects_fts"
+
+# Must match the indexed expression exactly for SQLite to use the index.
+MED_NORM_SQL = "lower(trim(medication))"
+
+
+def normalize_medication(name: str) -> str:
+    """
+    Normalized medication key: trimmed, lower-cased, single-spaced.
+    """
+    return re.sub(r"\s+", " ", name.strip().lower())
+
+
+# ---------------------------------------------------------
+# Migration: B-tree indexes + FTS5 table
+# ---------------------------------------------------------
+def migrate(conn: sqlite3.Connection, rebuild_fts: bool = False) -> None:
+    """
+    Create (or refresh) the indexes the query layer relies on:
+      - B-tree expression indexes on the normalized medication name
+      - an external-content FTS5 table over medication / side_effect /
+        outcome, kept in sync with triggers
+    Idempotent; safe to re-run after every data load.
+    """
+    conn.executescript(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_{TABLE}_med_norm
+            ON {TABLE}({MED_NORM_SQL});
+        CREATE INDEX IF NOT EXISTS idx_{TABLE}_med_norm_se
+            ON {TABLE}({MED_NORM_SQL}, side_effect);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            medication, side_effect, outcome,
+            content='{TABLE}', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_ai AFTER INSERT ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, medication, side_effect, outcome)
+            VALUES (new.rowid, new.medication, new.side_effect, new.outcome);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_ad AFTER DELETE ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, medication, side_effect, outcome)
+            VALUES ('delete', old.rowid, old.medication, old.side_effect, old.outcome);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_au AFTER UPDATE ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, medication, side_effect, outcome)
+            VALUES ('delete', old.rowid, old.medication, old.side_effect, old.outcome);
+            INSERT INTO {FTS_TABLE}(rowid, medication, side_effect, outcome)
+            VALUES (new.rowid, new.medication, new.side_effect, new.outcome);
+        END;
+        """
+    )
+
+    # Rows loaded before the triggers existed are not in the FTS index yet.
+    empty = conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}_docsize").fetchone()[0] == 0
+    if rebuild_fts or empty:
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def drop_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Drop the B-tree indexes and FTS sync triggers before a bulk load, so
+    inserts do not maintain them row by row. The FTS table itself is
+    kept; add the new rows with fts_append, then call migrate() to
+    recreate the rest.
+    """
+    conn.executescript(
+        f"""
+        DROP TRIGGER IF EXISTS {TABLE}_fts_ai;
+        DROP TRIGGER IF EXISTS {TABLE}_fts_ad;
+        DROP TRIGGER IF EXISTS {TABLE}_fts_au;
+        DROP INDEX IF EXISTS idx_{TABLE}_med_norm;
+        DROP INDEX IF EXISTS idx_{TABLE}_med_norm_se;
+        """
+    )
+
+
+def indexes_present(conn: sqlite3.Connection) -> bool:
+    """
+    True if the FTS table, its sync triggers and the B-tree indexes all
+    exist (False after a bulk load that stopped before migrate()).
+    """
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index', 'trigger')")}
+    expected = {
+        FTS_TABLE,
+        f"{TABLE}_fts_ai", f"{TABLE}_fts_ad", f"{TABLE}_fts_au",
+        f"idx_{TABLE}_med_norm", f"idx_{TABLE}_med_norm_se",
+    }
+    return expected <= names
+
+
+def fts_append(conn: sqlite3.Connection, after_rowid: int) -> int:
+    """
+    Index rows with rowid > after_rowid in an existing FTS table (rows
+    bulk-loaded while the triggers were dropped). Returns the number of
+    rows added; 0 if there is no FTS table yet (migrate() builds it).
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    if not exists:
+        return 0
+    cur = conn.execute(
+        f"""
+        INSERT INTO {FTS_TABLE}(rowid, medication, side_effect, outcome)
+        SELECT rowid, medication, side_effect, outcome FROM {TABLE} WHERE rowid > ?
+        """,
+        (after_rowid,),
+    )
+    return cur.rowcount
+
+
+# ---------------------------------------------------------
+# FTS5 query building
+# ---------------------------------------------------------
+def _fts_prefix(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"*'
+
+
+def _fts_medication(medication: str) -> str:
+    tokens = re.findall(r"\w+", medication.lower())
+    return "medication : (" + " AND ".join(_fts_prefix(t) for t in tokens) + ")"
+
+
+# ---------------------------------------------------------
+# Queries
+# ---------------------------------------------------------
+def rows_for_medication(
+    conn: sqlite3.Connection,
+    medication: str,
+    limit: int = 1000
+) -> pd.DataFrame:
+    """
+    All rows for a medication. Exact normalized-name matches come from
+    the B-tree index; if there are none, FTS5 token-prefix matching finds
+    names that contain the medication (e.g. "aspirin" -> "ASPIRIN 81MG").
+    """
+    med = normalize_medication(medication)
+    if not med:
+        return pd.DataFrame()
+
+    df = pd.read_sql_query(
+        f"SELECT * FROM {TABLE} WHERE {MED_NORM_SQL} = ? LIMIT ?",
+        conn,
+        params=(med, limit),
+    )
+    if not df.empty or not re.search(r"\w", med):
+        return df
+
+    return pd.read_sql_query(
+        f"""
+        SELECT s.* FROM {FTS_TABLE} f
+        JOIN {TABLE} s ON s.rowid = f.rowid
+        WHERE {FTS_TABLE} MATCH ?
+        LIMIT ?
+        """,
+        conn,
+        params=(_fts_medication(med), limit),
+    )
+
+
+def rows_for_names(
+    conn: sqlite3.Connection,
+    names: List[str],
+    limit: int = 1000
+) -> pd.DataFrame:
+    """
+    All rows whose normalized medication is one of `names` (e.g. every
+    strength variant of one drug, see medication_index), via the B-tree
+    index.
+    """
+    names = [normalize_medication(n) for n in names if n]
+    if not names:
+        return pd.DataFrame()
+
+    # Stay well under SQLITE_MAX_VARIABLE_NUMBER
+    frames = []
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        frames.append(pd.read_sql_query(
+            f"SELECT * FROM {TABLE} WHERE {MED_NORM_SQL} IN ({', '.join('?' * len(chunk))}) LIMIT ?",
+            conn,
+            params=(*chunk, limit),
+        ))
+    return pd.concat(frames, ignore_index=True).head(limit)
+
+
+def search_side_effects(
+    conn: sqlite3.Connection,
+    medication: str | None,
+    terms: List[str],
+    limit: int = 200,
+    phrases: List[str] = ()
+) -> pd.DataFrame:
+    """
+    Rows whose side_effect or outcome matches any of `terms` (token
+    prefix match) or whose side_effect contains any of `phrases`,
+    optionally restricted to a medication. Best matches (FTS5 bm25 rank)
+    first.
+    """
+    # Prefix matching on the singular also catches the plural
+    # ("headaches" -> "headache"*).
+    terms = [t[:-1] if len(t) > 4 and t.endswith("s") else t for t in terms if re.search(r"\w", t)]
+    clauses = [_fts_prefix(t) for t in terms]
+    for phrase in phrases:
+        tokens = re.findall(r"\w+", phrase.lower())
+        if tokens:
+            clauses.append('"' + " ".join(tokens) + '"')
+    if not clauses:
+        return pd.DataFrame()
+
+    match = "{side_effect outcome} : (" + " OR ".join(clauses) + ")"
+    if medication and re.search(r"\w", medication):
+        match = f"{_fts_medication(normalize_medication(medication))} AND {match}"
+
+    return pd.read_sql_query(
+        f"""
+        SELECT s.* FROM {FTS_TABLE} f
+        JOIN {TABLE} s ON s.rowid = f.rowid
+        WHERE {FTS_TABLE} MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+        """,
+        conn,
+        params=(match, limit),
+    )
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain side_effects indexes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="create/refresh B-tree and FTS5 indexes")
+    m.add_argument("db_path", nargs="?", default=DB_PATH)
+    m.add_argument("--rebuild-fts", action="store_true", help="rebuild the FTS index from scratch")
+    args = parser.parse_args()
+
+    conn = connect_readwrite(args.db_path)
+    try:
+        start = time.perf_counter()
+        migrate(conn, rebuild_fts=args.rebuild_fts)
+        print(f"Migrated {args.db_path} in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,218 @@
 # domain_extractors.py
 
-from typing import List
-from bs4 import BeautifulSoup
+import re
+from typing import List, NamedTuple, Pattern
 
+import soupsieve as sv
+from bs4 import BeautifulSoup, Tag
 
-def extract_fda(html: str) -> List[str]:
+
+# ---------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:  # pragma: no cover - lxml is in requirements.txt
+    PARSER = "html.parser"
+
+NON_VISIBLE_TAGS = ["script", "style", "noscript", "template", "svg"]
+
+
+def parse_html(html: str | BeautifulSoup) -> BeautifulSoup:
     """
-    FDA drug label pages:
-    - 'Adverse Reactions' sections with lists/paragraphs.
+    Parse a page once with the fastest available parser and drop
+    non-visible elements. Already-parsed soups are returned unchanged so
+    callers can share one tree between several extractors.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    results = set()
+    if isinstance(html, BeautifulSoup):
+        return html
+
+    soup = BeautifulSoup(html, PARSER)
+    for tag in soup(NON_VISIBLE_TAGS):
+        tag.decompose()
+    return soup
+
 
-    for h in soup.find_all(["h2", "h3"]):
-        if "adverse reactions" in h.get_text(" ", strip=True).lower():
+# ---------------------------------------------------------
+# Declarative section rules
+# ---------------------------------------------------------
+class SectionRule(NamedTuple):
+    """
+    How to find side-effect sections on a site.
+
+    headings   : compiled CSS selector for candidate heading tags
+    title      : regex a heading's text must match to start a section
+    scope      : "siblings" -> the run of <p>/<ul>/<ol> right after the heading
+                 "next"     -> the first element after the heading matching `container`
+    container  : compiled CSS selector used when scope == "next"
+    paragraphs : how <p> text in a sibling run is used:
+                 "whole" (one item), "phrases" (short comma/semicolon parts)
+                 or None (ignored)
+    """
+    headings: sv.SoupSieve
+    title: Pattern
+    scope: str
+    container: sv.SoupSieve | None = None
+    paragraphs: str | None = None
+
+
+class Section(NamedTuple):
+    heading: str
+    elements: List[Tag]
+
+
+SIBLING_TAGS = ("p", "ul", "ol")
+
+FDA_RULE = SectionRule(
+    headings=sv.compile("h2, h3"),
+    title=re.compile(r"adverse reactions", re.I),
+    scope="siblings",
+    paragraphs="whole",
+)
+
+MAYO_RULE = SectionRule(
+    headings=sv.compile("h2"),
+    title=re.compile(r"side effects", re.I),
+    scope="next",
+    container=sv.compile("div"),
+)
+
+DRUGS_COM_RULE = SectionRule(
+    headings=sv.compile("h2"),
+    title=re.compile(r"side effects", re.I),
+    scope="next",
+    container=sv.compile("ul"),
+)
+
+MEDLINEPLUS_RULE = SectionRule(
+    headings=sv.compile("h2"),
+    title=re.compile(r"side effects", re.I),
+    scope="next",
+    container=sv.compile("div.section-body"),
+)
+
+GENERAL_RULE = SectionRule(
+    headings=sv.compile("h1, h2, h3, h4"),
+    title=re.compile(r"side effects|adverse reactions|side-effects", re.I),
+    scope="siblings",
+    paragraphs="phrases",
+)
+
+# Checked in order against the URL's netloc.
+DOMAIN_RULES = [
+    ("fda.gov", FDA_RULE),
+    ("mayoclinic.org", MAYO_RULE),
+    ("drugs.com", DRUGS_COM_RULE),
+    ("medlineplus.gov", MEDLINEPLUS_RULE),
+]
+
+
+def rule_for_domain(domain: str) -> SectionRule:
+    for key, rule in DOMAIN_RULES:
+        if key in domain:
+            return rule
+    return GENERAL_RULE
+
+
+# ---------------------------------------------------------
+# Rule engine
+# ---------------------------------------------------------
+def find_sections(soup: BeautifulSoup, rule: SectionRule) -> List[Section]:
+    """
+    Return one Section (heading text + content elements) per heading
+    matched by `rule`.
+    """
+    sections: List[Section] = []
+
+    for h in rule.headings.select(soup):
+        heading = h.get_text(" ", strip=True)
+        if not rule.title.search(heading):
+            continue
+
+        if rule.scope == "siblings":
+            body = []
             sib = h.find_next_sibling()
-            while sib and sib.name in ["p", "ul", "ol"]:
-                if sib.name in ["ul", "ol"]:
-                    for li in sib.find_all("li"):
-                        results.add(li.get_text(" ", strip=True))
-                elif sib.name == "p":
-                    results.add(sib.get_text(" ", strip=True))
+            while sib is not None and sib.name in SIBLING_TAGS:
+                body.append(sib)
                 sib = sib.find_next_sibling()
+        else:
+            found = h.find_next(rule.container.match)
+            body = [found] if found is not None else []
+
+        if body:
+            sections.append(Section(heading, body))
+
+    return sections
+
+
+def items_from_section(section: Section, rule: SectionRule) -> List[str]:
+    items: List[str] = []
+
+    for el in section.elements:
+        if el.name == "p":
+            paragraph = el.get_text(" ", strip=True)
+            if rule.paragraphs == "whole":
+                items.append(paragraph)
+            elif rule.paragraphs == "phrases":
+                items.extend(short_phrases(paragraph))
+        else:
+            for li in el.find_all("li"):
+                items.append(li.get_text(" ", strip=True))
+
+    return items
+
+
+def short_phrases(text: str) -> List[str]:
+    items: List[str] = []
+    for part in re.split(r"[;,]", text):
+        part = part.strip()
+        if 0 < len(part.split()) <= 6:
+            items.append(part)
+    return items
 
+
+def extract_with_rule(html: str | BeautifulSoup, rule: SectionRule) -> List[str]:
+    soup = parse_html(html)
+    results = set()
+
+    for section in find_sections(soup, rule):
+        results.update(items_from_section(section, rule))
+
+    results.discard("")
     return sorted(results)
 
 
-def extract_mayo(html: str) -> List[str]:
+# ---------------------------------------------------------
+# Per-site entry points
+# ---------------------------------------------------------
+def extract_fda(html: str | BeautifulSoup) -> List[str]:
     """
-    Mayo Clinic:
-    - 'Side effects' sections with lists under nearby divs.
+    FDA drug label pages:
+    - 'Adverse Reactions' sections with lists/paragraphs.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    results = set()
+    return extract_with_rule(html, FDA_RULE)
 
-    for h in soup.find_all("h2"):
-        if "side effects" in h.get_text(" ", strip=True).lower():
-            container = h.find_next("div")
-            if container:
-                for li in container.find_all("li"):
-                    results.add(li.get_text(" ", strip=True))
 
-    return sorted(results)
+def extract_mayo(html: str | BeautifulSoup) -> List[str]:
+    """
+    Mayo Clinic:
+    - 'Side effects' sections with lists under nearby divs.
+    """
+    return extract_with_rule(html, MAYO_RULE)
 
 
-def extract_drugs_com(html: str) -> List[str]:
+def extract_drugs_com(html: str | BeautifulSoup) -> List[str]:
     """
     Drugs.com:
     - 'Side Effects' section with lists (often class-based).
     """
-    soup = BeautifulSoup(html, "html.parser")
-    results = set()
-
-    for h in soup.find_all("h2"):
-        if "side effects" in h.get_text(" ", strip=True).lower():
-            for ul in h.find_all_next("ul"):
-                for li in ul.find_all("li"):
-                    results.add(li.get_text(" ", strip=True))
-                break
+    return extract_with_rule(html, DRUGS_COM_RULE)
 
-    return sorted(results)
 
-
-def extract_medlineplus(html: str) -> List[str]:
+def extract_medlineplus(html: str | BeautifulSoup) -> List[str]:
     """
     MedlinePlus:
     - 'Side Effects' sections inside 'section-body' divs.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    results = set()
-
-    for h in soup.find_all("h2"):
-        if "side effects" in h.get_text(" ", strip=True).lower():
-            section = h.find_next("div", class_="section-body")
-            if section:
-                for li in section.find_all("li"):
-                    results.add(li.get_text(" ", strip=True))
-
-    return sorted(results)
+    return extract_with_rule(html, MEDLINEPLUS_RULE)
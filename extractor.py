@@ -2,82 +2,116 @@
 
 import re
 from urllib.parse import urlparse
-from typing import List
+from typing import List, Tuple
 
 from bs4 import BeautifulSoup
 
 from domain_extractors import (
-    extract_fda,
-    extract_mayo,
-    extract_drugs_com,
-    extract_medlineplus,
+    GENERAL_RULE,
+    extract_with_rule,
+    find_sections,
+    items_from_section,
+    parse_html,
+    rule_for_domain,
 )
 
 
-def extract_general(html: str) -> List[str]:
+# Applied to visible text only (never raw markup), so the lazy
+# patterns cannot wander through <script> blocks or attribute soup.
+GENERAL_PATTERNS = [
+    re.compile(r"common side effects include[:\-]?\s*(.*?)(?:\.|\n)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"side effects may include[:\-]?\s*(.*?)(?:\.|\n)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"may cause[:\-]?\s*(.*?)(?:\.|\n)", re.IGNORECASE | re.DOTALL),
+]
+
+
+def extract_general(html: str | BeautifulSoup) -> List[str]:
     """
     General-purpose extractor for side effects when no domain-specific
     rules are defined. Uses headings + regex heuristics.
+    The regex heuristics run over the visible text of the matched
+    sections, or over the page's visible text if no heading matched.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = parse_html(html)
     results = set()
 
-    for h in soup.find_all(["h1", "h2", "h3", "h4"]):
-        text = h.get_text(" ", strip=True).lower()
-        if "side effects" in text or "adverse reactions" in text or "side-effects" in text:
-            sib = h.find_next_sibling()
-            while sib and sib.name in ["p", "ul", "ol"]:
-                if sib.name in ["ul", "ol"]:
-                    for li in sib.find_all("li"):
-                        results.add(li.get_text(" ", strip=True))
-                elif sib.name == "p":
-                    paragraph = sib.get_text(" ", strip=True)
-                    results.update(_extract_short_phrases(paragraph))
-                sib = sib.find_next_sibling()
-
-    patterns = [
-        r"common side effects include[:\-]?\s*(.*?)(?:\.|\n)",
-        r"side effects may include[:\-]?\s*(.*?)(?:\.|\n)",
-        r"may cause[:\-]?\s*(.*?)(?:\.|\n)",
-    ]
-
-    for pattern in patterns:
-        matches = re.findall(pattern, html, flags=re.IGNORECASE | re.DOTALL)
-        for m in matches:
+    sections = find_sections(soup, GENERAL_RULE)
+    for section in sections:
+        results.update(items_from_section(section, GENERAL_RULE))
+
+    if sections:
+        text = "\n".join(
+            el.get_text(" ", strip=True) for section in sections for el in section.elements
+        )
+    else:
+        body = soup.body or soup
+        text = body.get_text("\n", strip=True)
+
+    for pattern in GENERAL_PATTERNS:
+        for m in pattern.findall(text):
             for item in re.split(r"[;,]", m):
                 cleaned = item.strip()
                 if cleaned:
                     results.add(cleaned)
 
+    results.discard("")
     return sorted(results)
 
 
-def _extract_short_phrases(text: str) -> List[str]:
-    items: List[str] = []
-    for part in re.split(r"[;,]", text):
-        part = part.strip()
-        if 0 < len(part.split()) <= 6:
-            items.append(part)
-    return items
+def extract_section_blocks(url: str, html: str | BeautifulSoup) -> List[Tuple[str, List[str]]]:
+    """
+    Visible text of the side-effects section(s) of a page as
+    (heading, blocks) pairs, one block per paragraph or list item.
+    Falls back to a single untitled section with the page's visible body
+    text when no section is recognised.
+    """
+    soup = parse_html(html)
+    rule = rule_for_domain(urlparse(url).netloc.lower())
+
+    result: List[Tuple[str, List[str]]] = []
+    for section in find_sections(soup, rule):
+        blocks: List[str] = []
+        for el in section.elements:
+            items = el.find_all("li")
+            if items:
+                blocks.extend(li.get_text(" ", strip=True) for li in items)
+            else:
+                blocks.append(el.get_text(" ", strip=True))
+        result.append((section.heading, [b for b in blocks if b]))
+
+    if not result:
+        body = soup.body or soup
+        result.append(("", [line for line in body.get_text("\n", strip=True).split("\n") if line]))
+
+    return result
 
 
-def extract_side_effects(url: str, html: str) -> List[str]:
+def extract_section_text(url: str, html: str | BeautifulSoup, limit: int = 4000) -> str:
     """
-    Domain router: chooses the best extractor for the URL.
-    Falls back to general extraction if no domain match.
+    Visible text of the side-effects section(s) of a page, for use as
+    LLM context. Whitespace is collapsed and the result is capped at
+    `limit` characters.
     """
-    domain = urlparse(url).netloc.lower()
+    parts = []
+    for heading, blocks in extract_section_blocks(url, html):
+        if heading:
+            parts.append(heading + ":")
+        parts.extend(blocks)
 
-    if "fda.gov" in domain:
-        return extract_fda(html)
+    text = re.sub(r"\s+", " ", " ".join(parts)).strip()
+    return text[:limit]
 
-    if "mayoclinic.org" in domain:
-        return extract_mayo(html)
 
-    if "drugs.com" in domain:
-        return extract_drugs_com(html)
+def extract_side_effects(url: str, html: str | BeautifulSoup) -> List[str]:
+    """
+    Domain router: chooses the best extractor for the URL.
+    Falls back to general extraction if no domain match.
+    The page is parsed exactly once; the domain rule runs against that tree.
+    """
+    domain = urlparse(url).netloc.lower()
+    rule = rule_for_domain(domain)
 
-    if "medlineplus.gov" in domain:
-        return extract_medlineplus(html)
+    if rule is GENERAL_RULE:
+        return extract_general(html)
 
-    return extract_general(html)
+    return extract_with_rule(html, rule)
@@ -0,0 +1,361 @@
+# ingest_faers.py
+#
+# Build or extend DrugData/CapstoneRJ.db from FAERS quarterly ASCII
+# extracts ('$'-delimited DRUGyyQq / REACyyQq / OUTCyyQq and, if present,
+# DEMOyyQq files, unpacked or still inside the downloaded .zip).
+#
+# Each file is streamed in chunks into a temporary staging table with
+# executemany; SQLite then joins the staging tables on primaryid and
+# appends one side_effects row per (drug, reaction) of every report.
+# Memory use is bounded by the chunk size, not by the quarter.
+#
+# Quarters already recorded in `ingested_quarters` are skipped, so new
+# quarters are appended without reloading old ones. Indexes and FTS sync
+# triggers are dropped during the load and rebuilt once afterwards (also
+# when a quarter fails, and on the next run if the process was killed),
+# and the per-medication statistics (aggregates.py) are recomputed.
+#
+# Usage:
+#   python ingest_faers.py faers_ascii_2024Q1.zip faers_ascii_2024Q2/ [--db PATH]
+
+import argparse
+import csv
+import io
+import os
+import re
+import sqlite3
+import time
+import zipfile
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import pandas as pd
+
+import db_queries
+from aggregates import STATS_TABLE, build_stats
+from db import DB_PATH
+
+
+CHUNK_ROWS = 200_000
+
+_FILE_NAME = re.compile(r"(?:^|/)(DRUG|REAC|OUTC|DEMO)(\d\d)Q([1-4])\.txt$", re.IGNORECASE)
+
+# Staging table -> FAERS columns kept from that file
+STAGING_COLUMNS = {
+    "DRUG": ["primaryid", "drugname", "role_cod"],
+    "REAC": ["primaryid", "pt"],
+    "OUTC": ["primaryid", "outc_cod"],
+    "DEMO": ["primaryid", "mfr_sndr"],
+}
+REQUIRED_FILES = ("DRUG", "REAC")
+
+# side_effects column -> expression over the staging join
+TARGET_COLUMNS = {
+    "medication": "d.drugname",
+    "side_effect": "r.pt",
+    "drug_manufacturer": "dm.mfr_sndr",
+    "drug_suspicion": "d.role_cod",
+    "outcome": "o.outc",
+    "primaryid": "d.primaryid",
+    "quarter": ":quarter",
+}
+
+
+class QuarterFiles(NamedTuple):
+    quarter: str                      # e.g. "2024Q1"
+    files: Dict[str, Tuple[str, str]]  # kind -> (container, member); container "" = plain file
+
+
+# ---------------------------------------------------------
+# Finding input files
+# ---------------------------------------------------------
+def find_quarters(paths: List[str]) -> List[QuarterFiles]:
+    """
+    FAERS files under the given directories / zip files, grouped by
+    quarter, oldest first.
+    """
+    found: Dict[str, Dict[str, Tuple[str, str]]] = {}
+
+    def add(container: str, member: str) -> None:
+        m = _FILE_NAME.search(member.replace("\\", "/"))
+        if m:
+            kind, yy, q = m.group(1).upper(), m.group(2), m.group(3)
+            found.setdefault(f"20{yy}Q{q}", {})[kind] = (container, member)
+
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                for member in zf.namelist():
+                    add(path, member)
+        elif os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    add("", os.path.join(root, name))
+        else:
+            add("", path)
+
+    return [QuarterFiles(q, files) for q, files in sorted(found.items())]
+
+
+def read_chunks(container: str, member: str, columns: List[str]) -> Iterator[pd.DataFrame]:
+    """
+    Stream a '$'-delimited FAERS file in CHUNK_ROWS chunks, keeping
+    only `columns` (header names are matched case-insensitively).
+    """
+    wanted = set(columns)
+    kwargs = dict(
+        sep="$",
+        dtype=str,
+        chunksize=CHUNK_ROWS,
+        quoting=csv.QUOTE_NONE,
+        on_bad_lines="skip",
+        usecols=lambda c: c.strip().lower() in wanted,
+        keep_default_na=False,
+        na_values=[""],
+    )
+
+    if container:
+        with zipfile.ZipFile(container) as zf, zf.open(member) as raw:
+            text = io.TextIOWrapper(raw, encoding="latin-1", newline="")
+            for chunk in pd.read_csv(text, **kwargs):
+                yield _tidy(chunk, columns)
+    else:
+        for chunk in pd.read_csv(member, encoding="latin-1", **kwargs):
+            yield _tidy(chunk, columns)
+
+
+def _tidy(chunk: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    chunk.columns = [c.strip().lower() for c in chunk.columns]
+    for col in columns:
+        if col not in chunk.columns:
+            chunk[col] = None
+    chunk = chunk[columns]
+    return chunk.apply(lambda s: s.str.strip())
+
+
+# ---------------------------------------------------------
+# Loading
+# ---------------------------------------------------------
+def ensure_schema(conn: sqlite3.Connection) -> List[str]:
+    """
+    Create side_effects / ingested_quarters if missing, and add the
+    primaryid / quarter columns to an older side_effects table (its
+    existing rows get NULL). Returns the side_effects columns this
+    loader can fill.
+    """
+    conn.executescript(
+        f"""
+        CREATE TABLE IF NOT EXISTS {db_queries.TABLE} (
+            medication        TEXT,
+            side_effect       TEXT,
+            drug_manufacturer TEXT,
+            drug_suspicion    TEXT,
+            outcome           TEXT,
+            primaryid         INTEGER,
+            quarter           TEXT
+        );
+        CREATE TABLE IF NOT EXISTS ingested_quarters (
+            quarter     TEXT PRIMARY KEY,
+            rows        INTEGER NOT NULL,
+            seconds     REAL NOT NULL,
+            loaded_at   REAL NOT NULL
+        );
+        """
+    )
+    existing = {r[1].lower(): r[1] for r in conn.execute(f"PRAGMA table_info({db_queries.TABLE})")}
+    for column, sql_type in (("primaryid", "INTEGER"), ("quarter", "TEXT")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {db_queries.TABLE} ADD COLUMN {column} {sql_type}")
+            existing[column] = column
+    conn.commit()
+    return [existing[c] for c in TARGET_COLUMNS if c in existing]
+
+
+def loaded_quarters(conn: sqlite3.Connection) -> set:
+    return {r[0] for r in conn.execute("SELECT quarter FROM ingested_quarters")}
+
+
+def quarter_rows_tagged(conn: sqlite3.Connection, quarter: str) -> bool:
+    """
+    True if side_effects holds rows tagged with `quarter`, or the quarter
+    was recorded with no rows at all.
+    """
+    recorded = conn.execute("SELECT rows FROM ingested_quarters WHERE quarter = ?", (quarter,)).fetchone()
+    if recorded is not None and recorded[0] == 0:
+        return True
+    return conn.execute(
+        f"SELECT 1 FROM {db_queries.TABLE} WHERE quarter = ? LIMIT 1", (quarter,)
+    ).fetchone() is not None
+
+
+def stage_file(conn: sqlite3.Connection, kind: str, container: str, member: str) -> int:
+    """
+    Stream one FAERS file into TEMP table stg_<kind>. Returns rows staged.
+    """
+    columns = STAGING_COLUMNS[kind]
+    table = f"stg_{kind.lower()}"
+    conn.execute(f"DROP TABLE IF EXISTS temp.{table}")
+    conn.execute(f"CREATE TEMP TABLE {table} ({', '.join(c + ' TEXT' for c in columns)})")
+
+    sql = f"INSERT INTO temp.{table} VALUES ({', '.join('?' * len(columns))})"
+    rows = 0
+    start = time.perf_counter()
+    with conn:
+        for chunk in read_chunks(container, member, columns):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            conn.executemany(sql, chunk.itertuples(index=False, name=None))
+            rows += len(chunk)
+
+    if kind != "DRUG":
+        conn.execute(f"CREATE INDEX temp.idx_{table}_pid ON {table}(primaryid)")
+    _report(f"  staged {os.path.basename(member)}", rows, time.perf_counter() - start)
+    return rows
+
+
+def ingest_quarter(conn: sqlite3.Connection, qf: QuarterFiles, columns: List[str]) -> int:
+    """
+    Stage one quarter's files and append its joined rows to side_effects
+    in a single transaction. Returns rows inserted.
+    """
+    start = time.perf_counter()
+    for kind in STAGING_COLUMNS:
+        if kind in qf.files:
+            stage_file(conn, kind, *qf.files[kind])
+        else:
+            conn.execute(f"DROP TABLE IF EXISTS temp.stg_{kind.lower()}")
+            conn.execute(
+                f"CREATE TEMP TABLE stg_{kind.lower()} ({', '.join(c + ' TEXT' for c in STAGING_COLUMNS[kind])})"
+            )
+
+    targets = {c.lower(): c for c in columns}
+    select = ", ".join(TARGET_COLUMNS[c] for c in targets)
+    join_start = time.perf_counter()
+    with conn:
+        cur = conn.execute(
+            f"""
+            INSERT INTO {db_queries.TABLE} ({', '.join(targets.values())})
+            SELECT {select}
+            FROM temp.stg_drug d
+            JOIN temp.stg_reac r ON r.primaryid = d.primaryid
+            LEFT JOIN (
+                SELECT primaryid, group_concat(outc_cod, ',') AS outc
+                FROM temp.stg_outc GROUP BY primaryid
+            ) o ON o.primaryid = d.primaryid
+            LEFT JOIN temp.stg_demo dm ON dm.primaryid = d.primaryid
+            WHERE d.drugname IS NOT NULL AND r.pt IS NOT NULL
+            """,
+            {"quarter": qf.quarter},
+        )
+        inserted = cur.rowcount
+        conn.execute(
+            "INSERT OR REPLACE INTO ingested_quarters (quarter, rows, seconds, loaded_at) VALUES (?, ?, ?, ?)",
+            (qf.quarter, inserted, time.perf_counter() - start, time.time()),
+        )
+    _report(f"  joined {qf.quarter}", inserted, time.perf_counter() - join_start)
+
+    for kind in STAGING_COLUMNS:
+        conn.execute(f"DROP TABLE IF EXISTS temp.stg_{kind.lower()}")
+    return inserted
+
+
+def ingest(paths: List[str], db_path: str = DB_PATH, force: bool = False) -> int:
+    """
+    Append every not-yet-loaded quarter found under `paths` to the
+    database, then rebuild indexes and aggregate tables. Returns total
+    rows inserted.
+    """
+    quarters = find_quarters(paths)
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -262144")      # 256 MiB
+        conn.execute("PRAGMA temp_store = FILE")         # staging can exceed RAM
+
+        columns = ensure_schema(conn)
+        done = loaded_quarters(conn)
+        todo = []
+        for qf in quarters:
+            missing = [k for k in REQUIRED_FILES if k not in qf.files]
+            if missing:
+                print(f"{qf.quarter}: skipped, missing {', '.join(missing)} file(s)")
+            elif qf.quarter in done and not force:
+                print(f"{qf.quarter}: already loaded")
+            elif qf.quarter in done and not quarter_rows_tagged(conn, qf.quarter):
+                # Loaded before side_effects had a quarter column: its rows
+                # cannot be told apart, reloading would duplicate them
+                print(f"{qf.quarter}: loaded without quarter tags, cannot be replaced; skipped")
+            else:
+                todo.append(qf)
+        if not todo:
+            if not db_queries.indexes_present(conn):
+                # An earlier load stopped before its indexes were rebuilt
+                print("Indexes / FTS triggers missing, rebuilding")
+                finish_load(conn, rebuild_fts=True)
+            return 0
+
+        last_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {db_queries.TABLE}").fetchone()[0]
+        db_queries.drop_indexes(conn)
+
+        total, start, loaded = 0, time.perf_counter(), False
+        try:
+            for qf in todo:
+                print(f"{qf.quarter}:")
+                if qf.quarter in done:
+                    # --force: replace the quarter's rows
+                    with conn:
+                        conn.execute(f"DELETE FROM {db_queries.TABLE} WHERE quarter = ?", (qf.quarter,))
+                total += ingest_quarter(conn, qf, columns)
+            _report("Loaded", total, time.perf_counter() - start)
+            loaded = True
+        finally:
+            # Also when a quarter failed: the quarters before it are
+            # committed and a rerun would find nothing left to load.
+            # Reloaded quarters deleted rows the FTS index still holds.
+            reloaded = any(qf.quarter in done for qf in todo)
+            finish_load(conn, rebuild_fts=reloaded or not loaded, after_rowid=last_rowid)
+        return total
+    finally:
+        conn.close()
+
+
+def finish_load(conn: sqlite3.Connection, rebuild_fts: bool, after_rowid: int = 0) -> None:
+    """
+    Index rows loaded after `after_rowid` (or rebuild the whole FTS
+    index), recreate what drop_indexes removed and recompute the
+    aggregate tables.
+    """
+    index_start = time.perf_counter()
+    if not rebuild_fts:
+        with conn:
+            db_queries.fts_append(conn, after_rowid)
+    db_queries.migrate(conn, rebuild_fts=rebuild_fts)
+    print(f"Indexes rebuilt in {time.perf_counter() - index_start:.1f}s")
+
+    stats_start = time.perf_counter()
+    pairs = build_stats(conn)
+    print(f"{STATS_TABLE}: {pairs:,} rows in {time.perf_counter() - stats_start:.1f}s")
+
+
+def _report(label: str, rows: int, seconds: float) -> None:
+    rate = rows / seconds if seconds > 0 else 0.0
+    print(f"{label}: {rows:,} rows in {seconds:.1f}s ({rate:,.0f} rows/s)")
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load FAERS quarterly ASCII extracts into SQLite.")
+    parser.add_argument("paths", nargs="+", help="FAERS .zip files, directories or .txt files")
+    parser.add_argument("--db", default=DB_PATH, help=f"database to create/extend (default {DB_PATH})")
+    parser.add_argument("--force", action="store_true", help="reload quarters that were already loaded")
+    args = parser.parse_args()
+
+    ingest(args.paths, args.db, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# llm_backends.py
+#
+# Where llm_client sends chat completions. A backend only talks to one
+# provider; rate limits, retries and coalescing stay in llm_client.
+#
+#   LLM_BACKEND=openai  (default) OpenAI API, needs OPENAI_API_KEY;
+#                        LLM_BASE_URL points it at any compatible endpoint
+#   LLM_BACKEND=local   OpenAI-compatible server at LLM_BASE_URL, no key,
+#                        e.g. llm_standin_server.py for offline runs
+
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+
+LOCAL_BASE_URL = "http://127.0.0.1:8089/v1"
+
+
+class LLMBackend(ABC):
+    """
+    Interface of a chat-completion backend. All methods run on
+    llm_client's event loop. Subclasses must implement complete and
+    stream; instantiating one that does not raises TypeError.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, model: str, messages: List[dict], temperature: float) -> Tuple[str, int | None]:
+        """
+        (answer text, total tokens used or None if unknown)
+        """
+
+    @abstractmethod
+    def stream(self, model: str, messages: List[dict], temperature: float) -> AsyncIterator[str]:
+        """
+        Async iterator of answer chunks.
+        """
+
+    def retry_after(self, error: Exception) -> float | None:
+        """
+        None if `error` is not worth retrying, else the server's
+        requested wait in seconds (0.0 = no preference).
+        """
+        return None
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Chat completions through the OpenAI SDK. The SDK's own retries are
+    off; llm_client retries.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: str | None = None, base_url: str | None = None, timeout: float = 120.0):
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "OPENAI_API_KEY environment variable not set. "
+                "Set it before running the app, or use LLM_BACKEND=local."
+            )
+        self.base_url = base_url
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+    async def complete(self, model: str, messages: List[dict], temperature: float) -> Tuple[str, int | None]:
+        response = await self._client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature
+        )
+        used = response.usage.total_tokens if response.usage else None
+        return (response.choices[0].message.content or "").strip(), used
+
+    async def stream(self, model: str, messages: List[dict], temperature: float) -> AsyncIterator[str]:
+        stream = await self._client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature, stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def retry_after(self, error: Exception) -> float | None:
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code != 429 and error.status_code < 500:
+                return None                    # bad request, auth, not found ...
+            header = error.response.headers.get("retry-after") if error.response is not None else None
+            try:
+                return float(header) if header else 0.0
+            except ValueError:
+                return 0.0
+        if isinstance(error, openai.APIConnectionError):    # includes timeouts
+            return 0.0
+        return None
+
+
+class LocalBackend(OpenAIBackend):
+    """
+    A local OpenAI-compatible server (llm_standin_server.py or a
+    self-hosted model). No API key needed.
+    """
+
+    name = "local"
+
+    def __init__(self, base_url: str | None = None, timeout: float = 120.0):
+        super().__init__(api_key="local", base_url=base_url or LOCAL_BASE_URL, timeout=timeout)
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+
+def make_backend(name: str | None = None, base_url: str | None = None, timeout: float = 120.0) -> LLMBackend:
+    """
+    Backend selected by `name` / $LLM_BACKEND, at `base_url` / $LLM_BASE_URL.
+    """
+    name = (name or os.getenv("LLM_BACKEND") or "openai").strip().lower()
+    base_url = base_url or os.getenv("LLM_BASE_URL") or None
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
+    return BACKENDS[name](base_url=base_url, timeout=timeout)
@@ -1,61 +1,396 @@
 # llm_client.py
+#
+# One LLM client for the whole process. Requests from every Streamlit
+# session, pipeline stage and batch worker go through a shared event loop
+# on a background thread, where they are
+#   - limited to LLM_MAX_CONCURRENCY requests in flight,
+#   - paced by token buckets for requests and tokens per minute,
+#   - retried with jittered exponential backoff on 429 / 5xx / network
+#     errors (honouring Retry-After),
+#   - coalesced: an identical request already in flight is awaited
+#     instead of being sent again.
+# The provider is a backend from llm_backends.py, created on first use,
+# so importing this module needs no API key. Settings come from the
+# environment or a .env file:
+#   LLM_BACKEND / LLM_BASE_URL   which backend, and where (llm_backends.py)
+#   OPENAI_API_KEY               for the default openai backend
+#   LLM_RPM, LLM_TPM, ...        limits, see below
+# Failures raise LLMError; callers decide how to show them.
 
+import asyncio
+import concurrent.futures
+import hashlib
+import json
 import os
-from typing import List, Dict
-from dotenv import load_dotenv
+import queue
+import random
+import threading
+import time
+from typing import Iterator
 
-from openai import OpenAI
+from dotenv import load_dotenv
 
-# Load environment variables
+# Before the imports below, which read their paths from the environment
 load_dotenv()
 
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-# -----------------------------
-# Configure OpenAI client
-# -----------------------------
-# Make sure you set:
-# export OPENAI_API_KEY="your-key"
-#
-# Or on Windows PowerShell:
-# setx OPENAI_API_KEY "your-key"
-# llm_client.py
+from answer_cache import get_answer_cache
+from context_packer import count_tokens
+from llm_backends import LLMBackend, make_backend
+from sql_templates import get_template_cache
 
-import os
-from openai import OpenAI
+
+DEFAULT_MODEL = "gpt-4.1"
+TEMPERATURE = 0.2
+
+# Per process; set them a little below the account's limits
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "200000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))      # seconds per attempt
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+COMPLETION_TOKENS_ESTIMATE = 800     # charged up front, corrected from usage
+
+
+class LLMError(Exception):
+    """
+    The LLM request failed (after retries, if the error was retryable).
+    """
 
 
 # ---------------------------------------------------------
-# Load API key from environment
+# Rate limiting
 # ---------------------------------------------------------
-API_KEY = os.getenv("OPENAI_API_KEY")
+class TokenBucket:
+    """
+    `per_minute` units, refilled continuously; at most one minute's worth
+    is banked. Waiters are served in arrival order. per_minute <= 0
+    disables the limit. Used only on the client's event loop.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
 
-if not API_KEY:
-    raise ValueError(
-        "OPENAI_API_KEY environment variable not set. "
-        "Set it before running the app."
-    )
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
 
-client = OpenAI(api_key=API_KEY)
+    async def acquire(self, n: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        n = min(n, self.capacity)     # an oversized request waits for a full bucket
+        async with self._lock:
+            self._refill()
+            while self.level < n:
+                await asyncio.sleep((n - self.level) / self.rate)
+                self._refill()
+            self.level -= n
+
+    def adjust(self, n: float) -> None:
+        """
+        Charge (n > 0) or refund (n < 0) units once the real cost is
+        known. The level may go negative; later requests then wait.
+        """
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - n)
+
+
+def _retry_delay(backend: LLMBackend, attempt: int, error: Exception) -> float | None:
+    """
+    Seconds to wait before retrying after `error`, or None if it is not
+    worth retrying. The server's Retry-After wins; otherwise full jitter:
+    uniform(0, base * 2^attempt), capped.
+    """
+    retry_after = backend.retry_after(error)
+    if retry_after is None:
+        return None
+    if retry_after > 0:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def request_key(model: str, messages: list, temperature: float) -> str:
+    payload = json.dumps([model, temperature, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# Client
+# ---------------------------------------------------------
+class LLMClient:
+    """
+    Thread-safe front end; all requests run on one background event loop.
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend | None = None,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.backend = backend or make_backend(timeout=LLM_TIMEOUT)
+        self.max_retries = max_retries
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._inflight: dict[str, concurrent.futures.Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True).start()
+
+    def set_limits(self, rpm: float | None = None, tpm: float | None = None) -> None:
+        """
+        Replace the requests / tokens per minute limits (e.g. from a CLI
+        flag). Meant to be called before requests are made.
+        """
+        if rpm is not None:
+            self._requests = TokenBucket(rpm)
+        if tpm is not None:
+            self._tokens = TokenBucket(tpm)
+
+    # ---- one request, on the loop ----
+    async def _attempts(self, messages: list, send):
+        """
+        Run `send()` (one API attempt) under the concurrency and rate
+        limits, retrying retryable errors. `send` returns (result, tokens
+        used or None). The semaphore is held only while a request is in
+        flight, never during backoff, so throttled requests do not block
+        fresh ones.
+        """
+        estimate = sum(count_tokens(m.get("content") or "") for m in messages) + COMPLETION_TOKENS_ESTIMATE
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire()
+            await self._tokens.acquire(estimate)
+            try:
+                async with self._semaphore:
+                    result, used = await send()
+            except Exception as e:
+                # The estimate stays charged: a failed attempt (429s
+                # included) still counts against the provider's limits,
+                # and refunding it would let the retries through at once
+                delay = _retry_delay(self.backend, attempt, e) if attempt < self.max_retries else None
+                if delay is None:
+                    raise LLMError(str(e)) from e
+                await asyncio.sleep(delay)
+                continue
+            if used is not None:
+                self._tokens.adjust(used - estimate)
+            return result
+
+    async def _complete(self, model: str, messages: list, temperature: float) -> str:
+        async def send():
+            return await self.backend.complete(model, messages, temperature)
+
+        return await self._attempts(messages, send)
+
+    async def _stream_into(self, model: str, messages: list, temperature: float,
+                           out: queue.Queue) -> str:
+        """
+        Stream the answer, putting each chunk on `out`. Retries happen
+        only before the first chunk; after that an error ends the stream.
+        """
+        parts: list[str] = []
+
+        async def send():
+            try:
+                async for delta in self.backend.stream(model, messages, temperature):
+                    parts.append(delta)
+                    out.put(delta)
+            except Exception as e:
+                if parts:
+                    # Part of the answer is already out; not retryable
+                    raise LLMError(f"stream interrupted: {e}") from e
+                raise
+            return "".join(parts).strip(), None
+
+        return await self._attempts(messages, send)
+
+    # ---- coalescing ----
+    def _shared(self, key: str, start) -> tuple[concurrent.futures.Future, bool]:
+        """
+        The in-flight future for `key`, or a new one from `start()`.
+        Returns (future, started_here).
+        """
+        with self._inflight_lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return fut, False
+            fut = start()
+            self._inflight[key] = fut
+
+        def forget(f, key=key):
+            with self._inflight_lock:
+                if self._inflight.get(key) is f:
+                    del self._inflight[key]
+
+        fut.add_done_callback(forget)
+        return fut, True
+
+    def submit(self, messages: list, model: str = DEFAULT_MODEL,
+               temperature: float = TEMPERATURE) -> concurrent.futures.Future:
+        """
+        Future of the answer text (raises LLMError). Shared with any
+        identical request still in flight.
+        """
+        key = request_key(model, messages, temperature)
+        fut, _ = self._shared(key, lambda: asyncio.run_coroutine_threadsafe(
+            self._complete(model, messages, temperature), self._loop
+        ))
+        return fut
+
+    def complete(self, messages: list, model: str = DEFAULT_MODEL,
+                 temperature: float = TEMPERATURE) -> str:
+        return self.submit(messages, model, temperature).result()
+
+    async def acomplete(self, messages: list, model: str = DEFAULT_MODEL,
+                        temperature: float = TEMPERATURE) -> str:
+        return await asyncio.wrap_future(self.submit(messages, model, temperature))
+
+    def stream(self, messages: list, model: str = DEFAULT_MODEL,
+               temperature: float = TEMPERATURE) -> Iterator[str]:
+        """
+        Answer chunks as they arrive (raises LLMError). If an identical
+        request is already in flight, its full answer is yielded in one
+        piece when it completes. The request runs to completion even if
+        the caller stops reading, so waiting duplicates still get it.
+        """
+        key = request_key(model, messages, temperature)
+        chunks: queue.Queue = queue.Queue()
+        fut, started = self._shared(key, lambda: asyncio.run_coroutine_threadsafe(
+            self._stream_into(model, messages, temperature, chunks), self._loop
+        ))
+        if not started:
+            yield fut.result()
+            return
+
+        fut.add_done_callback(lambda f: chunks.put(None))
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        fut.result()          # raise the stream's error, if any
+
+
+_client: LLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """
+    The process-wide client. Raises LLMError if the configured backend
+    cannot be created (e.g. no API key); the next call tries again.
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    _client = LLMClient()
+                except ValueError as e:
+                    raise LLMError(str(e)) from e
+
+    return _client
 
 
 # ---------------------------------------------------------
 # Generic LLM call
 # ---------------------------------------------------------
-def call_llm(system_prompt: str, messages: list, model: str = "gpt-4.1") -> str:
+def call_llm(
+    system_prompt: str,
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    cache_key: str | None = None,
+    cache_version: str = "",
+) -> str:
     """
     Call the LLM with a system prompt + list of messages.
     messages = [ { "role": "user", "content": "..." }, ... ]
+
+    With a `cache_key` (see answer_cache.make_key) the answer is served
+    from / stored in the answer cache, valid only for `cache_version`
+    (see answer_cache.data_version). Errors are never cached.
+
+    Raises LLMError if the request fails.
+    """
+    cache = get_answer_cache() if cache_key else None
+    if cache is not None:
+        cached = cache.get(cache_key, cache_version)
+        if cached is not None:
+            return cached
+
+    answer = get_client().complete([{"role": "system", "content": system_prompt}, *messages], model)
+
+    if cache is not None:
+        cache.put(cache_key, answer, cache_version)
+    return answer
+
+
+async def acall_llm(
+    system_prompt: str,
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    cache_key: str | None = None,
+    cache_version: str = "",
+) -> str:
+    """
+    call_llm for async callers (any event loop).
+    """
+    cache = get_answer_cache() if cache_key else None
+    if cache is not None:
+        cached = cache.get(cache_key, cache_version)
+        if cached is not None:
+            return cached
+
+    answer = await get_client().acomplete([{"role": "system", "content": system_prompt}, *messages], model)
+
+    if cache is not None:
+        cache.put(cache_key, answer, cache_version)
+    return answer
+
+
+# ---------------------------------------------------------
+# Streaming LLM call
+# ---------------------------------------------------------
+def stream_llm(
+    system_prompt: str,
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    cache_key: str | None = None,
+    cache_version: str = "",
+) -> Iterator[str]:
     """
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": system_prompt}, *messages],
-            temperature=0.2,
-        )
-        return response.choices[0].message.content.strip()
+    Same as call_llm, but yields the answer in chunks as the model
+    produces them. A cached answer is yielded in one piece. The full
+    text is cached once the stream completes.
+    """
+    cache = get_answer_cache() if cache_key else None
+    if cache is not None:
+        cached = cache.get(cache_key, cache_version)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    for chunk in get_client().stream([{"role": "system", "content": system_prompt}, *messages], model):
+        parts.append(chunk)
+        yield chunk
 
-    except Exception as e:
-        return f"LLM error: {e}"
+    if cache is not None:
+        cache.put(cache_key, "".join(parts).strip(), cache_version)
 
 
 # ---------------------------------------------------------
@@ -65,7 +400,14 @@ def generate_sql_from_question(question: str, medication: str | None) -> str:
     """
     Convert a natural-language question into a safe SQLite SELECT query.
     Always include the medication name if provided.
+
+    Questions whose intent already has a SQL template (built-in or learned
+    from an earlier LLM answer) are answered without calling the LLM.
     """
+    templates = get_template_cache()
+    cached_sql = templates.lookup(question, medication)
+    if cached_sql is not None:
+        return cached_sql
 
     med_clause = ""
     if medication:
@@ -103,5 +445,8 @@ def generate_sql_from_question(question: str, medication: str | None) -> str:
         raise ValueError(f"Unsafe SQL generated: {sql}")
     print ( " ...........rpint sql ......................")
     print ( sql)
+
+    # Remember the shape of this query for the next question like it
+    templates.learn(question, medication, sql.strip())
     return sql.strip()  
 
@@ -1,30 +1,10 @@
 # llm_client_openai.py
-from dotenv import load_dotenv
-import os
-from openai import OpenAI
-
-# Load environment variables
-load_dotenv()
-
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-# -----------------------------
-# Configure OpenAI client
-# -----------------------------
-# Make sure you set:
-# export OPENAI_API_KEY="your-key"
 #
-# Or on Windows PowerShell:
-# setx OPENAI_API_KEY "your-key"
+# Kept for older callers: same call_llm(system_prompt, user_message)
+# signature, now served by the shared client in llm_client.py (rate
+# limits, retries, request coalescing).
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not API_KEY:
-    raise ValueError(
-        "OPENAI_API_KEY environment variable not set. "
-        "Set it before running the Streamlit app."
-    )
-
-client = OpenAI(api_key=API_KEY)
+from llm_client import DEFAULT_MODEL, LLMError, get_client
 
 
 # -----------------------------
@@ -48,18 +28,15 @@ def call_llm(system_prompt: str, user_message: str) -> str:
     """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1",   # You can change to gpt-4o, gpt-4.1-mini, etc.
-            messages=[
+        return get_client().complete(
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_message},
             ],
-            temperature=0.2,
+            model=DEFAULT_MODEL,
         )
 
-        return response.choices[0].message.content.strip()
-
-    except Exception as e:
+    except LLMError as e:
         return (
             "The language model encountered an error while generating a response. "
             f"Technical details: {e}"
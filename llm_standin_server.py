@@ -0,0 +1,247 @@
+# llm_standin_server.py
+#
+# Local OpenAI-compatible stand-in for load tests and offline runs.
+# Implements POST /v1/chat/completions (plain and stream=true SSE) and
+# GET /v1/models with deterministic answers:
+#   - the SQL-generator prompt (llm_client.generate_sql_from_question)
+#     gets a canned SELECT for the named medication,
+#   - any other prompt gets a templated answer listing the side effects
+#     of the SOURCE MAP in its context,
+#   - or the first matching entry of --canned FILE
+#     ([{"match": "substring of the last user message", "response": "..."}]).
+# Latency before the first token, token rate and a 429 rate are
+# configurable, so the client's pacing and retries are exercised too.
+#
+# Usage:
+#   python llm_standin_server.py [--port 8089] [--latency 0.3] [--tokens-per-second 60]
+#   LLM_BACKEND=local LLM_BASE_URL=http://127.0.0.1:8089/v1 streamlit run app.py
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+DEFAULT_PORT = 8089
+MAX_SIDE_EFFECTS = 15
+
+
+class StandInConfig:
+    def __init__(self, latency: float = 0.3, tokens_per_second: float = 60.0,
+                 error_rate: float = 0.0, canned: List[Dict] | None = None, seed: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.canned = canned or []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+# ---------------------------------------------------------
+# Responses
+# ---------------------------------------------------------
+def sql_response(system_prompt: str) -> str:
+    m = re.search(r"The medication name is '([^']*)'", system_prompt)
+    if not m:
+        return "SELECT * FROM side_effects LIMIT 200"
+    medication = m.group(1).lower().replace("'", "''")
+    return f"SELECT * FROM side_effects WHERE LOWER(medication) LIKE '%{medication}%' LIMIT 200"
+
+
+def answer_response(context: str) -> str:
+    """
+    A short answer built from the context's SOURCE MAP lines
+    ("- nausea: FDA Data from SQLite, drugs.com").
+    """
+    source_map = context.split("SOURCE MAP:", 1)[1] if "SOURCE MAP:" in context else ""
+    source_map = source_map.split("STRUCTURED DATA", 1)[0]
+    entries = re.findall(r"^- ([^:\n]+): (.+)$", source_map, flags=re.MULTILINE)
+
+    if not entries:
+        return "No side-effect information was found for this medication in the provided data."
+
+    lines = ["Reported side effects, with their sources:"]
+    lines += [f"- {se} ({sources})" for se, sources in entries[:MAX_SIDE_EFFECTS]]
+    if len(entries) > MAX_SIDE_EFFECTS:
+        lines.append(f"...and {len(entries) - MAX_SIDE_EFFECTS} more.")
+    lines.append("This is general information, not medical advice; ask a doctor or pharmacist.")
+    return "\n".join(lines)
+
+
+def respond(messages: List[Dict], config: StandInConfig) -> str:
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    user = [m.get("content") or "" for m in messages if m.get("role") == "user"]
+    last_user = user[-1] if user else ""
+
+    for entry in config.canned:
+        if entry.get("match", "") in last_user:
+            return entry.get("response", "")
+    if "SQL generator" in system:
+        return sql_response(system)
+    return answer_response(last_user)
+
+
+def _tokens(text: str) -> List[str]:
+    # Word-sized pieces, whitespace kept, so chunks join back to `text`
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+def _count(messages: List[Dict]) -> int:
+    return sum(len(_tokens(m.get("content") or "")) for m in messages)
+
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = "LLMStandIn/1.0"
+    protocol_version = "HTTP/1.1"
+    config: StandInConfig = StandInConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload: Dict, headers: Dict[str, str] | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "stand-in", "object": "model"}]})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json(400, {"error": {"message": "invalid JSON"}})
+            return
+
+        config = self.config
+        if config.should_fail():
+            self._json(429, {"error": {"message": "rate limited (stand-in)", "type": "rate_limit"}},
+                       {"Retry-After": "0.2"})
+            return
+
+        messages = request.get("messages") or []
+        model = request.get("model") or "stand-in"
+        text = respond(messages, config)
+        pieces = _tokens(text)
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        time.sleep(config.latency)
+
+        if not request.get("stream"):
+            time.sleep(delay * len(pieces))
+            prompt_tokens = _count(messages)
+            self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                          "total_tokens": prompt_tokens + len(pieces)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: Dict, finish: str | None = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for piece in pieces:
+                time.sleep(delay)
+                event({"content": piece})
+            event({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass     # client stopped reading
+
+
+def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          config: StandInConfig | None = None) -> ThreadingHTTPServer:
+    """
+    Start the server on a daemon thread (port 0 = any free port; see
+    server.server_address). Stop it with server.shutdown().
+    """
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), {"config": config or StandInConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-standin", daemon=True).start()
+    return server
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="0 = no delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --error-rate")
+    parser.add_argument("--canned", help="JSON list of {match, response} entries")
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned, encoding="utf-8") as f:
+            canned = json.load(f)
+
+    config = StandInConfig(args.latency, args.tokens_per_second, args.error_rate, canned, args.seed)
+    server = serve(args.host, args.port, config)
+    host, port = server.server_address[:2]
+    print(f"Stand-in LLM at http://{host}:{port}/v1 (LLM_BACKEND=local LLM_BASE_URL=http://{host}:{port}/v1)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
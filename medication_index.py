@@ -0,0 +1,351 @@
+# medication_index.py
+#
+# Medication dictionary built from the database: every raw `medication`
+# value is mapped to a canonical drug (an integer ID), so "ASPIRIN 81MG",
+# "Aspirin" and "Bayer" are one drug. Names are resolved exactly, by
+# prefix (trie, for autocomplete) or within a small edit distance
+# (deletion index, for misspellings).
+#
+# The dictionary is cached as JSON under DICTIONARY_PATH and rebuilt
+# when the database file changes.
+
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from db import DB_PATH, file_fingerprint, read_connection
+
+
+DICTIONARY_PATH = os.getenv("MEDICATION_DICTIONARY_PATH", "DrugData/medications.json")
+MAX_EDITS = 2
+FORMAT_VERSION = 1
+
+# Strengths and dosage forms that do not change which drug it is
+_STRENGTH = re.compile(
+    r"\b\d+(?:[.,]\d+)?\s*(?:mg|mcg|ug|g|ml|l|iu|units?|%|meq|mmol)(?:/\s*\w+)?\b|\b\d+(?:[.,]\d+)?\b"
+)
+DOSAGE_WORDS = {
+    "tablet", "tablets", "tab", "tabs", "capsule", "capsules", "cap", "caps",
+    "oral", "solution", "suspension", "injection", "injectable", "syrup",
+    "cream", "ointment", "gel", "patch", "spray", "drops", "chewable",
+    "er", "xr", "sr", "cr", "xl", "dr", "ec", "od", "extended", "delayed",
+    "release", "film", "coated", "powder", "inhaler", "vial", "pen",
+}
+SALT_WORDS = {
+    "hydrochloride", "hcl", "sodium", "potassium", "calcium", "sulfate",
+    "sulphate", "maleate", "mesylate", "besylate", "citrate", "tartrate",
+    "succinate", "fumarate", "acetate", "phosphate", "bromide", "magnesium",
+    "chloride",
+}
+
+# Brand -> generic for common products; extend as needed.
+BRAND_GENERICS = {
+    "advil": "ibuprofen",
+    "motrin": "ibuprofen",
+    "tylenol": "acetaminophen",
+    "paracetamol": "acetaminophen",
+    "panadol": "acetaminophen",
+    "bayer": "aspirin",
+    "aleve": "naproxen",
+    "zofran": "ondansetron",
+    "lipitor": "atorvastatin",
+    "crestor": "rosuvastatin",
+    "zocor": "simvastatin",
+    "glucophage": "metformin",
+    "zoloft": "sertraline",
+    "prozac": "fluoxetine",
+    "lexapro": "escitalopram",
+    "xanax": "alprazolam",
+    "ambien": "zolpidem",
+    "synthroid": "levothyroxine",
+    "norvasc": "amlodipine",
+    "prilosec": "omeprazole",
+    "nexium": "esomeprazole",
+    "plavix": "clopidogrel",
+    "eliquis": "apixaban",
+    "xarelto": "rivaroxaban",
+    "coumadin": "warfarin",
+    "neurontin": "gabapentin",
+    "lyrica": "pregabalin",
+    "humira": "adalimumab",
+    "keytruda": "pembrolizumab",
+    "ozempic": "semaglutide",
+    "wegovy": "semaglutide",
+    "singulair": "montelukast",
+    "zyrtec": "cetirizine",
+    "benadryl": "diphenhydramine",
+}
+
+
+def canonical_name(raw: str) -> str:
+    """
+    Lower-cased drug name without strength, dosage form or salt words:
+    "ASPIRIN 81MG" -> "aspirin", "Ondansetron HCl tablets" -> "ondansetron".
+    Salt words are kept when nothing else is left ("sodium").
+    """
+    text = _STRENGTH.sub(" ", raw.lower())
+    words = [w for w in re.findall(r"[a-z][a-z0-9\-]*", text) if w not in DOSAGE_WORDS]
+    core = [w for w in words if w not in SALT_WORDS]
+    return " ".join(core or words)
+
+
+# ---------------------------------------------------------
+# Edit distance
+# ---------------------------------------------------------
+def _deletes(word: str, max_edits: int) -> Set[str]:
+    result = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal-string-alignment distance, or max_distance + 1 as soon as it
+    is known to exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _max_edits_for(word: str) -> int:
+    # Short names are too easy to confuse with each other
+    return 0 if len(word) <= 3 else 1 if len(word) <= 5 else MAX_EDITS
+
+
+# ---------------------------------------------------------
+# Dictionary
+# ---------------------------------------------------------
+class Resolution(NamedTuple):
+    med_id: int
+    name: str         # canonical name
+    match: str        # "exact" | "alias" | "fuzzy"
+
+
+class MedicationIndex:
+    """
+    names[i]     canonical name of medication i
+    reports[i]   number of rows in the database for it
+    variants[i]  raw (lower-cased, trimmed) `medication` values mapping to it
+    """
+
+    def __init__(self, names: List[str], reports: List[int], variants: List[List[str]]):
+        self.names = names
+        self.reports = reports
+        self.variants = variants
+
+        self.raw_to_id: Dict[str, int] = {v: i for i, vs in enumerate(variants) for v in vs}
+        self.aliases: Dict[str, int] = {name: i for i, name in enumerate(names)}
+        by_name = dict(self.aliases)
+        for brand, generic in BRAND_GENERICS.items():
+            if generic in by_name:
+                self.aliases.setdefault(brand, by_name[generic])
+
+        self._trie: Dict = {}
+        self._deletes: Dict[str, List[str]] = defaultdict(list)
+        for alias in self.aliases:
+            self._trie_insert(alias)
+            for d in _deletes(alias, _max_edits_for(alias)):
+                self._deletes[d].append(alias)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ---- build / persist ----
+    @classmethod
+    def from_counts(cls, counts: Iterable[Tuple[str, int]]) -> "MedicationIndex":
+        """
+        Build from (raw medication value, row count) pairs.
+        """
+        groups: Dict[str, Tuple[int, List[str]]] = {}
+        for raw, n in counts:
+            raw = (raw or "").strip().lower()
+            canon = canonical_name(raw)
+            if not canon:
+                continue
+            total, raws = groups.get(canon, (0, []))
+            raws.append(raw)
+            groups[canon] = (total + n, raws)
+
+        ordered = sorted(groups.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return cls(
+            [name for name, _ in ordered],
+            [total for _, (total, _) in ordered],
+            [raws for _, (_, raws) in ordered],
+        )
+
+    def save(self, path: str, source: str = "") -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "source": source, "names": self.names,
+                       "reports": self.reports, "variants": self.variants}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, source: str | None = None) -> "MedicationIndex | None":
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != FORMAT_VERSION:
+            return None
+        if source is not None and data.get("source") != source:
+            return None
+        return cls(data["names"], data["reports"], data["variants"])
+
+    # ---- trie ----
+    def _trie_insert(self, alias: str) -> None:
+        node = self._trie
+        for ch in alias:
+            node = node.setdefault(ch, {})
+        node[""] = alias
+
+    def _completions(self, prefix: str, cap: int) -> List[str]:
+        node = self._trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        found, stack = [], [node]
+        while stack and len(found) < cap:
+            node = stack.pop()
+            for ch, child in node.items():
+                if ch == "":
+                    found.append(child)
+                else:
+                    stack.append(child)
+        return found
+
+    # ---- lookups ----
+    def resolve(self, text: str) -> Resolution | None:
+        """
+        Canonical medication for user input: exact or brand name first,
+        then the same after stripping strength/form words, then the
+        closest name within the edit-distance bound (ties go to the most
+        reported drug).
+        """
+        query = " ".join(text.lower().split())
+        if not query:
+            return None
+
+        for candidate in (query, canonical_name(query)):
+            med_id = self.aliases.get(candidate)
+            if med_id is not None:
+                match = "exact" if self.names[med_id] == candidate else "alias"
+                return Resolution(med_id, self.names[med_id], match)
+
+        fuzzy = self.fuzzy(canonical_name(query) or query, limit=1)
+        if fuzzy:
+            med_id = self.aliases[fuzzy[0]]
+            return Resolution(med_id, self.names[med_id], "fuzzy")
+        return None
+
+    def fuzzy(self, text: str, limit: int = 5) -> List[str]:
+        """
+        Names/aliases within the edit-distance bound of `text`, closest first.
+        """
+        max_d = _max_edits_for(text)
+        candidates: Set[str] = set()
+        for d in _deletes(text, max_d):
+            candidates.update(self._deletes.get(d, ()))
+
+        scored = []
+        for alias in candidates:
+            dist = edit_distance(text, alias, max_d)
+            if dist <= max_d:
+                scored.append((dist, -self.reports[self.aliases[alias]], alias))
+        scored.sort()
+        return [alias for _, _, alias in scored[:limit]]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Autocomplete: canonical names whose name or brand alias starts
+        with `prefix` (most reported first), then fuzzy matches.
+        """
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return self.names[:limit]
+
+        ids: List[int] = []
+        for alias in self._completions(prefix, cap=limit * 20):
+            med_id = self.aliases[alias]
+            if med_id not in ids:
+                ids.append(med_id)
+        ids.sort(key=lambda i: -self.reports[i])
+
+        if len(ids) < limit:
+            for alias in self.fuzzy(canonical_name(prefix) or prefix, limit):
+                med_id = self.aliases[alias]
+                if med_id not in ids:
+                    ids.append(med_id)
+
+        return [self.names[i] for i in ids[:limit]]
+
+    def ids_for_raw(self, raw_values: Iterable[str]) -> List[int]:
+        """
+        Medication ID per raw `medication` value (-1 if unknown).
+        """
+        out = []
+        for raw in raw_values:
+            raw = (raw or "").strip().lower() if isinstance(raw, str) else ""
+            med_id = self.raw_to_id.get(raw)
+            if med_id is None:
+                med_id = self.aliases.get(canonical_name(raw), -1)
+            out.append(med_id)
+        return out
+
+
+def build_medication_index() -> MedicationIndex:
+    with read_connection() as conn:
+        rows = conn.execute(
+            "SELECT lower(trim(medication)), COUNT(*) FROM side_effects "
+            "WHERE medication IS NOT NULL GROUP BY lower(trim(medication))"
+        ).fetchall()
+    return MedicationIndex.from_counts(rows)
+
+
+_index: MedicationIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_medication_index() -> MedicationIndex:
+    """
+    Process-wide dictionary: loaded from DICTIONARY_PATH when it matches
+    the current database file, otherwise rebuilt and saved.
+    """
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                source = file_fingerprint(DB_PATH)
+                index = MedicationIndex.load(DICTIONARY_PATH, source)
+                if index is None:
+                    index = build_medication_index()
+                    try:
+                        index.save(DICTIONARY_PATH, source)
+                    except OSError:
+                        pass
+                _index = index
+
+    return _index
@@ -0,0 +1,223 @@
+# page_cache.py
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, NamedTuple
+
+
+CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "DrugData/page_cache.db")
+FRESH_TTL = 7 * 24 * 3600          # seconds a page is served without revalidation
+NEGATIVE_TTL = 24 * 3600           # seconds a 4xx result is remembered
+MAX_BYTES = 200 * 1024 * 1024      # compressed bodies kept on disk
+
+
+class CachedPage(NamedTuple):
+    url: str
+    body: str
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+
+# ---------------------------------------------------------
+# On-disk page store
+# ---------------------------------------------------------
+class PageCache:
+    """
+    SQLite-backed HTTP page cache.
+
+    Stores the (zlib-compressed) body together with the ETag and
+    Last-Modified validators. Entries younger than `ttl` are served
+    straight from disk; older ones are returned as stale so the caller
+    can revalidate them with a conditional request. Total size is bounded
+    by `max_bytes` using least-recently-used eviction.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_bytes: int = MAX_BYTES,
+        ttl: float = FRESH_TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "revalidated": 0,
+            "evictions": 0,
+        }
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url           TEXT PRIMARY KEY,
+                body          BLOB NOT NULL,
+                etag          TEXT,
+                last_modified TEXT,
+                fetched_at    REAL NOT NULL,
+                last_access   REAL NOT NULL,
+                size          INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages(last_access)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS failures (
+                url        TEXT PRIMARY KEY,
+                status     INTEGER NOT NULL,
+                reason     TEXT,
+                failed_at  REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, url: str) -> tuple[CachedPage | None, bool]:
+        """
+        Return (page, is_fresh). page is None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None, False
+
+            self._conn.execute(
+                "UPDATE pages SET last_access = ? WHERE url = ?", (now, url)
+            )
+            self._conn.commit()
+
+        body, etag, last_modified, fetched_at = row
+        page = CachedPage(url, zlib.decompress(body).decode("utf-8"), etag, last_modified, fetched_at)
+
+        fresh = (now - fetched_at) < self.ttl
+        self.stats["hits" if fresh else "stale"] += 1
+        return page, fresh
+
+    def put(
+        self,
+        url: str,
+        body: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        blob = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO pages
+                    (url, body, etag, last_modified, fetched_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (url, blob, etag, last_modified, now, now, len(blob)),
+            )
+            self._conn.execute("DELETE FROM failures WHERE url = ?", (url,))
+            self._evict_locked()
+            self._conn.commit()
+
+    # -----------------------------------------------------
+    # Negative cache (4xx results)
+    # -----------------------------------------------------
+    def lookup_failure(self, url: str) -> tuple[int, str] | None:
+        """
+        Return (status, reason) if `url` failed with a 4xx within
+        `negative_ttl`, else None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, reason, failed_at FROM failures WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None or time.time() - row[2] >= self.negative_ttl:
+            return None
+
+        self.stats["negative_hits"] += 1
+        return row[0], row[1]
+
+    def put_failure(self, url: str, status: int, reason: str = "") -> None:
+        """
+        Remember a permanent failure (see scraper.PERMANENT_STATUSES);
+        transient ones such as 429 must not be stored.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO failures (url, status, reason, failed_at) VALUES (?, ?, ?, ?)",
+                (url, status, reason, time.time()),
+            )
+            self._conn.commit()
+
+    def mark_revalidated(self, url: str) -> None:
+        """
+        A conditional request returned 304: the stored body is fresh again.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, last_access = ? WHERE url = ?",
+                (now, now, url),
+            )
+            self._conn.commit()
+        self.stats["revalidated"] += 1
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT url, size FROM pages ORDER BY last_access ASC"
+        ).fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM failures")
+            self._conn.commit()
+
+
+# ---------------------------------------------------------
+# Process-wide instance
+# ---------------------------------------------------------
+_cache: PageCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PageCache()
+
+    return _cache
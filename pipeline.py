@@ -0,0 +1,175 @@
+# pipeline.py
+#
+# The question pipeline as a small DAG of stages:
+#
+#   fetch ──> extract ──────────────┐
+#                                   ├──> context ──> answer
+#   sql_gen ──> sql_exec ───────────┤
+#                                   │
+#   stats ──────────────────────────┘
+#
+# Independent stages (scraping vs. SQL generation/execution) run at the
+# same time on a thread pool. Every stage has a timeout; a stage that
+# times out or fails yields its default value, so downstream stages
+# (and ultimately the answer) run with whatever did complete.
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+from agent import answer_prepared, build_prompt, fetch_stats, generate_sql, retrieve_rows
+from data_loader import build_docs, fetch_pages
+
+
+STAGE_TIMEOUTS = {
+    "fetch": 25.0,
+    "extract": 10.0,
+    "sql_gen": 20.0,
+    "sql_exec": 10.0,
+    "stats": 5.0,
+    "context": 5.0,
+    "answer": 90.0,
+}
+
+
+class Stage(NamedTuple):
+    """
+    name    : unique stage name
+    fn      : called with the values of `deps` as keyword arguments
+    deps    : names of stages whose results this stage needs
+    timeout : seconds before the stage is abandoned (None = no limit)
+    default : value used downstream if the stage times out or fails
+    """
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    timeout: float | None = None
+    default: Any = None
+
+
+class StageResult(NamedTuple):
+    value: Any
+    status: str          # "ok" | "timeout" | "error"
+    elapsed: float
+    error: str | None = None
+
+
+# ---------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------
+def run_stages(stages: List[Stage], max_workers: int = 6) -> Dict[str, StageResult]:
+    """
+    Run stages as soon as their dependencies have a result, overlapping
+    independent ones. Returns {name: StageResult} for every stage.
+
+    Threads cannot be killed: a timed-out stage keeps running in the
+    background, but nobody waits for it and its result is discarded.
+    """
+    results: Dict[str, StageResult] = {}
+    running: Dict[Future, Tuple[Stage, float]] = {}
+    started = set()
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage")
+    try:
+        while len(results) < len(stages):
+            for stage in stages:
+                if stage.name in started or not all(d in results for d in stage.deps):
+                    continue
+                kwargs = {d: results[d].value for d in stage.deps}
+                running[pool.submit(stage.fn, **kwargs)] = (stage, time.monotonic())
+                started.add(stage.name)
+
+            if not running:
+                missing = [s.name for s in stages if s.name not in results]
+                raise ValueError(f"Stages with unknown or cyclic dependencies: {missing}")
+
+            deadlines = [t0 + s.timeout for s, t0 in running.values() if s.timeout is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for fut, (stage, t0) in list(running.items()):
+                if fut in done:
+                    try:
+                        results[stage.name] = StageResult(fut.result(), "ok", now - t0)
+                    except Exception as e:
+                        results[stage.name] = StageResult(stage.default, "error", now - t0, str(e))
+                elif stage.timeout is not None and now - t0 >= stage.timeout:
+                    results[stage.name] = StageResult(
+                        stage.default, "timeout", now - t0, f"exceeded {stage.timeout}s"
+                    )
+                else:
+                    continue
+                del running[fut]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+# ---------------------------------------------------------
+# The question pipeline
+# ---------------------------------------------------------
+def question_stages(
+    df: pd.DataFrame,
+    urls: List[str],
+    question: str,
+    med_filter: str | None = None,
+    include_answer: bool = True,
+    timeouts: Dict[str, float] | None = None,
+) -> List[Stage]:
+    """
+    Stages for one question. With include_answer=False the DAG stops at
+    "context" (the prepared prompt), e.g. so app.py can stream the answer
+    itself.
+    """
+    t = {**STAGE_TIMEOUTS, **(timeouts or {})}
+
+    stages = [
+        Stage("fetch", lambda: fetch_pages(urls), timeout=t["fetch"], default={}),
+        Stage("extract", lambda fetch: build_docs(fetch), ("fetch",), t["extract"], []),
+        Stage("sql_gen", lambda: generate_sql(question, med_filter), timeout=t["sql_gen"]),
+        Stage(
+            "sql_exec",
+            lambda sql_gen: retrieve_rows(df, question, med_filter, sql_gen),
+            ("sql_gen",),
+            t["sql_exec"],
+            pd.DataFrame(),
+        ),
+        Stage("stats", lambda: fetch_stats(med_filter), timeout=t["stats"]),
+        Stage(
+            "context",
+            lambda extract, sql_exec, stats: build_prompt(sql_exec, extract, question, stats),
+            ("extract", "sql_exec", "stats"),
+            t["context"],
+        ),
+    ]
+
+    if include_answer:
+        stages.append(Stage(
+            "answer",
+            lambda context: answer_prepared(context) if context else "LLM error: no context",
+            ("context",),
+            t["answer"],
+            "LLM error: answer timed out",
+        ))
+
+    return stages
+
+
+def run_question_pipeline(
+    df: pd.DataFrame,
+    urls: List[str],
+    question: str,
+    med_filter: str | None = None,
+    include_answer: bool = True,
+    timeouts: Dict[str, float] | None = None,
+) -> Dict[str, StageResult]:
+    """
+    Run the question DAG. End-to-end latency is roughly
+    max(scrape, sql_gen + sql_exec) + answer instead of their sum.
+    """
+    stages = question_stages(df, urls, question, med_filter, include_answer, timeouts)
+    return run_stages(stages)
@@ -1,8 +1,256 @@
 # retrieval.py
 
+import re
+import threading
+import weakref
+from collections import OrderedDict
 from typing import List, Dict, Tuple
+import numpy as np
 import pandas as pd
 
+import db_queries
+from aggregates import stats_for_medication
+from bm25_index import BM25Index
+from db import read_connection
+from medication_index import Resolution, get_medication_index
+from semantic_index import MIN_SCORE, SemanticIndex, get_term_index
+
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for",
+    "from", "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or",
+    "the", "to", "what", "when", "which", "with", "you", "your", "about",
+    "any", "there", "this", "that", "these", "those",
+}
+
+# Question words that say nothing about which side effect is meant
+EXPANSION_IGNORE = {
+    "cause", "causes", "caused", "side", "effect", "effects", "get", "make",
+    "makes", "take", "taking", "symptom", "symptoms", "reaction", "reactions",
+}
+
+
+def query_terms(query: str) -> List[str]:
+    """
+    Lower-cased word tokens of a query, without stopwords.
+    """
+    return [t for t in re.findall(r"[a-z0-9]+", query.lower()) if t not in STOPWORDS]
+
+
+def index_terms(text: str) -> List[str]:
+    """
+    Tokens as stored in the BM25 indexes: query_terms with a trailing
+    plural "s" removed, so "headaches" and "headache" are the same term.
+    """
+    return [
+        t[:-1] if len(t) > 4 and t.endswith("s") and not t.endswith("ss") else t
+        for t in query_terms(text)
+    ]
+
+
+def expand_query(
+    query: str,
+    med_filter: str | None = None,
+    max_terms: int = 5,
+    min_score: float = MIN_SCORE
+) -> List[str]:
+    """
+    Side-effect terms from the database that are similar to the query's
+    words and word pairs (semantic_index term index), best first, e.g.
+    "upset stomach" -> ["dyspepsia", "nausea", ...]. Medication words
+    are ignored. Returns [] if the index is unavailable.
+    """
+    ignore = EXPANSION_IGNORE | set(query_terms(med_filter or ""))
+    words = [t for t in query_terms(query) if t not in ignore]
+    phrases = words + [" ".join(words[i:i + n]) for n in (2, 3) for i in range(len(words) - n + 1)]
+    if not phrases:
+        return []
+
+    try:
+        results = get_term_index().query(phrases, top_k=max_terms, min_score=min_score)
+    except Exception:
+        return []
+
+    best: Dict[str, float] = {}
+    for hits in results:
+        for score, term in hits:
+            best[term] = max(score, best.get(term, 0.0))
+    return sorted(best, key=lambda t: -best[t])[:max_terms]
+
+
+# ---------------------------------------------------------
+# BM25 indexes per document set
+#
+# One index per distinct set of scraped docs / passages, so IDF and
+# average length depend only on the documents being searched. The most
+# recently used sets are kept (the same drug's pages are usually asked
+# about several times in a row); older ones are dropped whole.
+# ---------------------------------------------------------
+DOC_SET_CACHE_SIZE = 32
+
+_doc_indexes: "OrderedDict[Tuple, BM25Index]" = OrderedDict()
+_passage_indexes: "OrderedDict[Tuple, BM25Index]" = OrderedDict()
+_doc_set_lock = threading.Lock()
+
+
+def _doc_set_index(cache: OrderedDict, keys: Tuple, build) -> BM25Index:
+    """
+    The index for this tuple of (id, text hash) keys, built by `build()`
+    on a miss. Least recently used sets are evicted beyond
+    DOC_SET_CACHE_SIZE.
+    """
+    with _doc_set_lock:
+        index = cache.get(keys)
+        if index is not None:
+            cache.move_to_end(keys)
+            return index
+
+    index = build()
+    with _doc_set_lock:
+        index = cache.setdefault(keys, index)
+        cache.move_to_end(keys)
+        while len(cache) > DOC_SET_CACHE_SIZE:
+            cache.popitem(last=False)
+    return index
+
+
+class _FrameIndex:
+    """
+    BM25 over the distinct side_effect / notes texts of one DataFrame,
+    with the row positions of each text. Rows appended to the frame are
+    indexed on the next search.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.ref = weakref.ref(frame)
+        self.lock = threading.Lock()     # held by _per_frame around update()
+        self.index = BM25Index()
+        self.rows: Dict[str, List[int]] = {}
+        self.indexed_rows = 0
+
+    def update(self, df: pd.DataFrame) -> None:
+        if len(df) <= self.indexed_rows:
+            return
+        new = df.iloc[self.indexed_rows:]
+        cols = [c for c in ("side_effect", "notes") if c in new.columns]
+        if not cols:
+            self.indexed_rows = len(df)
+            return
+        if len(cols) == 1:
+            texts = new[cols[0]]        # factorize works on Categorical codes directly
+        else:
+            texts = new[cols[0]].astype(str)
+            for col in cols[1:]:
+                texts = texts + " " + new[col].astype(str)
+
+        # Tokenize each distinct text once; rows only record positions
+        codes, uniques = pd.factorize(texts, sort=False)
+        groups = pd.Series(np.arange(self.indexed_rows, len(df))).groupby(codes).agg(list)
+        for code, positions in groups.items():
+            text = str(uniques[code])
+            if text not in self.rows:
+                self.rows[text] = []
+                self.index.add(text, index_terms(text))
+            self.rows[text].extend(positions)
+        self.indexed_rows = len(df)
+
+
+class _FrameMedications:
+    """
+    Medication ID of every row of one DataFrame (medication_index),
+    sorted so the rows of one drug are a binary search away. Rebuilt if
+    the frame's length changes.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.ref = weakref.ref(frame)
+        self.lock = threading.Lock()     # held by _per_frame around update()
+        self.rows = -1
+
+    def update(self, df: pd.DataFrame) -> None:
+        if len(df) == self.rows:
+            return
+        codes, uniques = pd.factorize(df["medication"])
+        ids = np.asarray(get_medication_index().ids_for_raw(uniques), dtype=np.int64)
+        row_ids = np.where(codes >= 0, ids[codes] if len(ids) else -1, -1)
+        self.order = np.argsort(row_ids, kind="stable")
+        self.sorted_ids = row_ids[self.order]
+        self.rows = len(df)
+
+    def positions(self, med_id: int) -> np.ndarray:
+        lo, hi = np.searchsorted(self.sorted_ids, [med_id, med_id + 1])
+        return self.order[lo:hi]
+
+
+# Streamlit sessions share the cached frame, so several threads may
+# search it at once
+_frame_indexes: Dict[Tuple[int, type], object] = {}
+_frame_lock = threading.Lock()
+
+
+def _per_frame(df: pd.DataFrame, kind: type):
+    """
+    The `kind` structure (_FrameIndex / _FrameMedications) for this
+    DataFrame object, created on first use and brought up to date.
+    """
+    with _frame_lock:
+        entry = _frame_indexes.get((id(df), kind))
+        if entry is None or entry.ref() is not df:
+            # Forget structures of frames that no longer exist
+            for key in [k for k, e in _frame_indexes.items() if e.ref() is None]:
+                del _frame_indexes[key]
+            entry = _frame_indexes[(id(df), kind)] = kind(df)
+    with entry.lock:
+        entry.update(df)
+    return entry
+
+
+# Match types applied without asking. A fuzzy match can be a different
+# drug ("prednisone" -> "prednisolone"); only the app's selectbox, where
+# the user sees and picks the name, offers those.
+RESOLVED_MATCHES = ("exact", "alias")
+
+
+def match_medication(name: str | None) -> Resolution | None:
+    """
+    Dictionary entry for user input, fuzzy matches included, or None if
+    there is none or the dictionary is unavailable.
+    """
+    if not name or not name.strip():
+        return None
+    try:
+        return get_medication_index().resolve(name)
+    except Exception:
+        return None
+
+
+def _resolved(name: str | None) -> Resolution | None:
+    match = match_medication(name)
+    return match if match is not None and match.match in RESOLVED_MATCHES else None
+
+
+def resolve_medication(name: str | None) -> str | None:
+    """
+    Canonical medication name for user input (exact, brand or strength
+    variant names), or the input unchanged if the dictionary has no such
+    match or is unavailable. Misspellings are not corrected here.
+    """
+    match = _resolved(name)
+    return match.name if match else name
+
+
+def _medication_positions(df: pd.DataFrame, med_filter: str) -> np.ndarray | None:
+    """
+    Row positions of a medication via its integer ID, or None if the
+    name cannot be resolved (callers then fall back to a substring scan).
+    """
+    if "medication" not in df.columns:
+        return None
+    match = _resolved(med_filter)
+    if match is None:
+        return None
+    return np.sort(_per_frame(df, _FrameMedications).positions(match.med_id))
+
 
 def filter_df_by_medication(
     df: pd.DataFrame,
@@ -10,6 +258,8 @@ def filter_df_by_medication(
 ) -> pd.DataFrame:
     """
     Optionally filter the SQLite side_effects DataFrame by medication name.
+    Resolved names are an integer-ID lookup (all strength variants and
+    brand names of the drug); unknown names fall back to a substring match.
     """
     if not med_filter:
         return df
@@ -18,38 +268,112 @@ def filter_df_by_medication(
     if not med_filter:
         return df
 
+    positions = _medication_positions(df, med_filter)
+    if positions is not None:
+        return df.iloc[positions]
+
     mask = df["medication"].str.contains(med_filter, case=False, na=False)
     return df[mask]
 
 
+def fetch_medication_rows(
+    med_filter: str,
+    limit: int = 1000
+) -> pd.DataFrame:
+    """
+    Rows for a medication straight from SQLite, via the normalized-name
+    index: every raw name of the resolved drug (medication_index), or
+    db_queries.rows_for_medication if the name does not resolve.
+    """
+    match = _resolved(med_filter)
+    with read_connection() as conn:
+        if match is not None:
+            variants = get_medication_index().variants[match.med_id]
+            return db_queries.rows_for_names(conn, variants, limit=limit)
+        return db_queries.rows_for_medication(conn, med_filter, limit=limit)
+
+
+def fetch_medication_stats(
+    med_filter: str | None,
+    limit: int = 500
+) -> pd.DataFrame | None:
+    """
+    Pre-aggregated side-effect statistics of the resolved medication
+    (aggregates.py), one indexed lookup. None if there is no medication,
+    it does not resolve, or the stats table has not been built.
+    """
+    match = _resolved(med_filter)
+    if match is None:
+        return None
+
+    with read_connection() as conn:
+        stats = stats_for_medication(conn, match.name, limit=limit)
+    return stats if not stats.empty else None
+
+
+def search_side_effects_in_db(
+    query: str,
+    med_filter: str | None = None,
+    top_k: int = 200
+) -> pd.DataFrame:
+    """
+    Indexed counterpart of search_side_effects_in_df: FTS5 search of
+    side_effect / outcome for the query's terms and for similar
+    side-effect terms (expand_query), restricted to a medication if
+    given. Falls back to the medication's rows when nothing matches,
+    like the DataFrame version falls back to head(top_k).
+    """
+    expansions = expand_query(query, med_filter)
+    with read_connection() as conn:
+        hits = db_queries.search_side_effects(
+            conn, med_filter, query_terms(query), limit=top_k, phrases=expansions
+        )
+        if hits.empty and med_filter:
+            hits = db_queries.rows_for_medication(conn, med_filter, limit=top_k)
+        return hits
+
+
 def search_side_effects_in_df(
     df: pd.DataFrame,
     query: str,
-    top_k: int = 50
+    top_k: int = 50,
+    med_filter: str | None = None
 ) -> pd.DataFrame:
     """
-    Very simple keyword search over 'side_effect' and 'notes' columns.
-    Returns a subset of df with rows that match query terms.
+    BM25 keyword search over 'side_effect' and 'notes' columns, best
+    matches first, optionally restricted to a medication. Falls back to
+    the first top_k (medication) rows when no term matches.
     """
     if df.empty:
         return df
 
-    q = query.lower().strip()
-    if not q:
-        return df.head(top_k)
+    mask = None
+    if med_filter and med_filter.strip():
+        positions = _medication_positions(df, med_filter)
+        if positions is not None:
+            mask = np.zeros(len(df), dtype=bool)
+            mask[positions] = True
+        else:
+            mask = df["medication"].str.contains(med_filter.strip(), case=False, na=False).to_numpy()
+
+    terms = index_terms(query)
+    positions: List[int] = []
 
-    cols_to_search = ["side_effect", "notes"]
-    mask = False
+    if terms:
+        fi = _per_frame(df, _FrameIndex)
+        allow = None
+        if mask is not None:
+            allow = lambda text: any(mask[r] for r in fi.rows[text])
 
-    for col in cols_to_search:
-        if col in df.columns:
-            mask = mask | df[col].astype(str).str.lower().str.contains(q, na=False)
+        for _, text in fi.index.search(terms, top_k, allow):
+            positions.extend(r for r in fi.rows[text] if mask is None or mask[r])
+            if len(positions) >= top_k:
+                break
 
-    hits = df[mask]
-    if hits.empty:
-        return df.head(top_k)
+    if not positions:
+        return (df if mask is None else df[mask]).head(top_k)
 
-    return hits.head(top_k)
+    return df.iloc[positions[:top_k]]
 
 
 def search_docs(
@@ -58,31 +382,68 @@ def search_docs(
     top_k: int = 5
 ) -> List[Dict]:
     """
-    Simple keyword search over scraped web documents.
-    Scores docs based on query term frequency in 'text' and 'side_effects'.
+    BM25 search over scraped web documents. A document is its 'text'
+    plus its 'side_effects' (counted twice, as a boost). Returns the
+    top_k matches, or the first top_k docs if nothing matches.
     """
     if not docs:
         return []
 
-    q = query.lower().strip()
-    if not q:
+    by_key: Dict[Tuple[str, int], Dict] = {}
+    for d in docs:
+        by_key[(d.get("url", ""), hash(d.get("text") or ""))] = d
+
+    def build() -> BM25Index:
+        index = BM25Index()
+        for key, d in by_key.items():
+            se_terms = index_terms(" ".join(d.get("side_effects", [])))
+            index.add(key, index_terms(d.get("text") or "") + se_terms * 2)
+        return index
+
+    index = _doc_set_index(_doc_indexes, tuple(by_key), build)
+    hits = index.search(index_terms(query), top_k)
+    if not hits:
         return docs[:top_k]
 
-    def score_doc(doc: Dict) -> int:
-        text = (doc.get("text") or "").lower()
-        se_list = [s.lower() for s in doc.get("side_effects", [])]
+    return [by_key[key] for _, key in hits]
 
-        score = text.count(q)
-        for se in se_list:
-            if q in se:
-                score += 2
-        return score
 
-    scored = [(score_doc(d), d) for d in docs]
-    scored = [pair for pair in scored if pair[0] > 0]
+def search_passages(
+    docs: List[Dict],
+    query: str,
+    top_k: int = 6
+) -> List[Dict]:
+    """
+    Rank the passages of scraped documents by BM25 relevance to the
+    query; section-heading terms count twice. If no passage shares a
+    word with the query, rank by character n-gram similarity instead.
+    Returns the top_k passages; if nothing matches, the first passage
+    of each document.
+    """
+    passages = [p for d in docs for p in d.get("passages", [])]
+    if not passages:
+        return []
 
-    if not scored:
-        return docs[:top_k]
+    by_key: Dict[Tuple[str, int], Dict] = {}
+    for p in passages:
+        by_key[(p["id"], hash(p["text"]))] = p
+
+    def build() -> BM25Index:
+        index = BM25Index()
+        for key, p in by_key.items():
+            index.add(key, index_terms(p["text"]) + index_terms(p.get("heading", "")) * 2)
+        return index
+
+    index = _doc_set_index(_passage_indexes, tuple(by_key), build)
+    hits = index.search(index_terms(query), top_k)
+    if not hits:
+        # No shared words: rank by character n-gram similarity instead
+        keys = list(by_key)
+        texts = [by_key[k].get("heading", "") + " " + by_key[k]["text"] for k in keys]
+        index = SemanticIndex.build([str(i) for i in range(len(keys))], texts)
+        hits = [(score, keys[int(i)]) for score, i in index.query([query], top_k=top_k, min_score=0.1)[0]]
+    if not hits:
+        firsts = [d["passages"][0] for d in docs if d.get("passages")]
+        return firsts[:top_k]
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [d for _, d in scored[:top_k]]
+    return [by_key[key] for _, key in hits]
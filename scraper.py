@@ -1,17 +1,298 @@
 # scraper.py
 
+import asyncio
+import email.utils
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CircuitOpenError, get_breaker
+from page_cache import get_page_cache
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; MedSideEffectsBot/1.0)"
+}
+
+REQUEST_TIMEOUT = 15      # seconds, per request (connect / read)
+TOTAL_DEADLINE = 20       # seconds, for a whole batch of URLs
+PER_DOMAIN_LIMIT = 2      # concurrent requests allowed per host
+MAX_WORKERS = 16
+
+# 4xx statuses that mean the URL itself is gone: negative-cached.
+# Others (429, 408, ...) are transient and only reported.
+PERMANENT_STATUSES = {403, 404, 410}
+# Throttling statuses: count against the domain's breaker
+THROTTLE_STATUSES = {408, 429}
+MAX_RETRY_AFTER = 3600    # seconds; longer Retry-After values are capped
+
+STREAM_MAX_BYTES = 512 * 1024   # hard byte budget for a streamed page
+STREAM_CHUNK = 16 * 1024
+
+# Complete <h1>/<h2> elements in a (possibly partial) byte buffer.
+_HEADING = re.compile(rb"<(h[12])\b[^>]*>(.{0,400}?)</\1\s*>", re.IGNORECASE | re.DOTALL)
+_SECTION_TITLE = re.compile(rb"side[ -]effects|adverse reactions", re.IGNORECASE)
+# Sub-headings (h3/h4) can also open the section, e.g. on FDA labels.
+_ANY_SECTION_HEADING = re.compile(
+    rb"<h[1-4]\b[^>]*>(?:(?!</h).){0,400}?(?:side[ -]effects|adverse reactions)", re.IGNORECASE | re.DOTALL
+)
+
+
+# ---------------------------------------------------------
+# Shared keep-alive session
+# ---------------------------------------------------------
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+# Dedicated pool so a batch that hits its deadline never blocks on
+# stragglers (asyncio.run() waits for the *default* executor to drain).
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="scraper")
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide requests.Session.
+    Connections are pooled and kept alive per host, so repeat fetches
+    to drugs.com / mayoclinic.org / medlineplus.gov skip the TCP + TLS
+    handshake.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_WORKERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(HEADERS)
+                _session = session
+
+    return _session
+
+
+def retry_after_seconds(resp: requests.Response) -> float | None:
+    """
+    The response's Retry-After (delta-seconds or HTTP date) in seconds,
+    capped at MAX_RETRY_AFTER, or None if absent or unparseable.
+    """
+    value = (resp.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def read_until_section_end(resp: requests.Response, max_bytes: int = STREAM_MAX_BYTES) -> str:
+    """
+    Read a streamed response incrementally and stop early.
+
+    Reading stops at the first top-level heading (<h1>/<h2>) that follows
+    the side-effects section, or once `max_bytes` have been read. The
+    rest of the page (footers, related links, trackers) is never
+    downloaded.
+    """
+    buf = bytearray()
+    section_seen = False
+    scan_from = 0
+
+    for chunk in resp.iter_content(chunk_size=STREAM_CHUNK):
+        buf.extend(chunk)
+        if len(buf) >= max_bytes:
+            del buf[max_bytes:]
+            break
+
+        if not section_seen:
+            start = _ANY_SECTION_HEADING.search(buf)
+            if start is None:
+                continue
+            section_seen = True
+            scan_from = start.end()
 
+        cut = None
+        for m in _HEADING.finditer(buf, scan_from):
+            scan_from = m.end()
+            if not _SECTION_TITLE.search(m.group(2)):
+                cut = m.start()
+                break
+        if cut is not None:
+            # Keep everything before the heading that closes the section.
+            del buf[cut:]
+            break
 
-def fetch_html(url: str) -> str:
+    return bytes(buf).decode(resp.encoding or "utf-8", errors="replace")
+
+
+def fetch_html(
+    url: str,
+    timeout: float = REQUEST_TIMEOUT,
+    use_cache: bool = True,
+    stream: bool = False,
+    max_bytes: int = STREAM_MAX_BYTES,
+) -> str:
     """
     Fetch raw HTML from a URL.
     You may want to integrate robots.txt checks separately if needed.
+
+    Pages are served from the on-disk page cache while fresh. Stale
+    entries are revalidated with If-None-Match / If-Modified-Since, so an
+    unchanged page costs a 304 instead of a full download.
+
+    URLs that recently returned a permanent 4xx (PERMANENT_STATUSES) are
+    not retried until the negative cache entry expires. A domain that
+    keeps timing out or returning 5xx is skipped (CircuitOpenError) until
+    its breaker lets a probe through; a 429 / 408 opens the breaker for
+    the server's Retry-After (or counts as a failure without one).
+
+    With stream=True the body is read incrementally and cut off right
+    after the side-effects section (see read_until_section_end); the
+    truncated page is what gets cached.
+    """
+    cache = get_page_cache() if use_cache else None
+    cached = None
+
+    if cache is not None:
+        cached, fresh = cache.lookup(url)
+        if cached is not None and fresh:
+            return cached.body
+
+        failure = cache.lookup_failure(url)
+        if failure is not None:
+            status, reason = failure
+            raise requests.HTTPError(f"{status} Client Error: {reason} for url: {url} (cached)")
+
+    breaker = get_breaker(urlparse(url).netloc.lower())
+    if not breaker.allow():
+        if cached is not None:
+            # Stale copy beats nothing while the domain is down.
+            return cached.body
+        raise CircuitOpenError(f"Skipping {url}: domain is failing, circuit open")
+
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    try:
+        resp = get_session().get(url, headers=headers, timeout=timeout, stream=stream)
+    except requests.RequestException:
+        # Any failure must be recorded, or a half-open probe would leave
+        # the breaker stuck refusing every call
+        breaker.record_failure()
+        raise
+
+    with resp:
+        if resp.status_code >= 500:
+            breaker.record_failure()
+            resp.raise_for_status()
+
+        if resp.status_code == 304 and cached is not None:
+            breaker.record_success()
+            cache.mark_revalidated(url)
+            return cached.body
+
+        if resp.status_code in THROTTLE_STATUSES:
+            # Being throttled: back off the whole domain, keep the URL
+            breaker.record_failure(retry_after_seconds(resp))
+            resp.raise_for_status()
+
+        if 400 <= resp.status_code < 500:
+            # The domain answered, so it is healthy even if the URL is dead.
+            breaker.record_success()
+            if cache is not None and resp.status_code in PERMANENT_STATUSES:
+                cache.put_failure(url, resp.status_code, resp.reason or "")
+            resp.raise_for_status()
+
+        try:
+            body = read_until_section_end(resp, max_bytes) if stream else resp.text
+        except requests.RequestException:
+            # e.g. ChunkedEncodingError / ContentDecodingError mid-body
+            breaker.record_failure()
+            raise
+
+    breaker.record_success()
+
+    if cache is not None:
+        cache.put(
+            url,
+            body,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
+
+    return body
+
+
+# ---------------------------------------------------------
+# Concurrent fetch engine
+# ---------------------------------------------------------
+async def fetch_many(
+    urls: List[str],
+    per_domain_limit: int = PER_DOMAIN_LIMIT,
+    timeout: float = REQUEST_TIMEOUT,
+    deadline: float = TOTAL_DEADLINE,
+    stream: bool = False,
+) -> Dict[str, str | Exception]:
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; MedSideEffectsBot/1.0)"
-    }
+    Fetch several URLs concurrently.
+
+    - At most `per_domain_limit` requests are in flight per host.
+    - No single request waits longer than `timeout`.
+    - The whole batch returns after at most `deadline` seconds; URLs
+      still pending at that point are reported as TimeoutError.
+
+    Returns {url: html} with an Exception in place of the html for
+    URLs that failed. Wall time is bounded by the slowest page (or the
+    deadline), not the sum of all pages. `stream` is passed through to
+    fetch_html.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def fetch_one(url: str) -> str:
+        domain = urlparse(url).netloc.lower()
+        sem = semaphores.setdefault(domain, asyncio.Semaphore(per_domain_limit))
+        async with sem:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                raise TimeoutError(f"Deadline of {deadline}s exceeded before fetching {url}")
+            return await loop.run_in_executor(
+                _executor,
+                partial(fetch_html, url, min(timeout, remaining), stream=stream),
+            )
+
+    # dict.fromkeys keeps order and drops duplicate URLs
+    tasks = {url: asyncio.ensure_future(fetch_one(url)) for url in dict.fromkeys(urls)}
+    if not tasks:
+        return {}
+
+    _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results: Dict[str, str | Exception] = {}
+    for url, task in tasks.items():
+        if task in pending:
+            results[url] = TimeoutError(f"Deadline of {deadline}s exceeded for {url}")
+        elif task.exception() is not None:
+            results[url] = task.exception()
+        else:
+            results[url] = task.result()
 
-    resp = requests.get(url, headers=headers, timeout=15)
-    resp.raise_for_status()
-    return resp.text
+    return results
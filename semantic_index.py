@@ -0,0 +1,265 @@
+# semantic_index.py
+#
+# Offline similarity search over short texts (side-effect terms,
+# passages): TF-IDF over hashed character n-grams, stored as an
+# L2-normalized sparse matrix so cosine similarity is one sparse product.
+#
+# The side-effect term index is built from the database, saved under
+# INDEX_DIR as .npy files and memory-mapped on the next start.
+
+import json
+import os
+import threading
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from db import file_fingerprint, read_connection
+
+
+INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "DrugData/semantic_index")
+DIMS = 1 << 18            # hashed feature space
+NGRAMS = (3, 4, 5)        # character n-gram sizes, within word boundaries
+MIN_SCORE = 0.45          # cosine similarity for a term to count as a match
+FORMAT_VERSION = 1
+
+# Lay descriptions of common FAERS (MedDRA) terms, indexed with the term
+# so "upset stomach" finds "dyspepsia" and "nausea".
+LAY_GLOSSES = {
+    "abdominal pain upper": "stomach ache",
+    "alopecia": "hair loss",
+    "arthralgia": "joint pain",
+    "asthenia": "weakness",
+    "constipation": "hard stools",
+    "diarrhoea": "loose stools",
+    "diarrhea": "loose stools",
+    "dyspepsia": "indigestion upset stomach heartburn",
+    "dyspnoea": "shortness of breath breathless",
+    "dyspnea": "shortness of breath breathless",
+    "epistaxis": "nosebleed",
+    "erythema": "skin redness",
+    "fatigue": "tiredness tired",
+    "haematuria": "blood in urine",
+    "hematuria": "blood in urine",
+    "hyperhidrosis": "excessive sweating",
+    "hypertension": "high blood pressure",
+    "hypotension": "low blood pressure",
+    "insomnia": "trouble sleeping",
+    "myalgia": "muscle pain aches",
+    "nausea": "feeling sick queasy upset stomach",
+    "oedema peripheral": "swollen legs ankles swelling",
+    "palpitations": "racing heartbeat",
+    "pruritus": "itching itchy skin",
+    "pyrexia": "fever high temperature",
+    "somnolence": "drowsiness sleepy",
+    "syncope": "fainting passing out",
+    "tinnitus": "ringing in the ears",
+    "urticaria": "hives",
+    "vertigo": "dizziness spinning",
+    "vomiting": "throwing up being sick",
+}
+
+
+# ---------------------------------------------------------
+# Featurization
+# ---------------------------------------------------------
+def _features(text: str) -> List[int]:
+    """
+    Hashed character n-grams of each word (padded with spaces so
+    prefixes and suffixes are distinct), plus the word itself.
+    """
+    feats = []
+    for word in text.lower().split():
+        word = "".join(ch for ch in word if ch.isalnum())
+        if not word:
+            continue
+        feats.append(zlib.crc32(b"w:" + word.encode("utf-8")) % DIMS)
+        padded = f" {word} ".encode("utf-8")
+        for n in NGRAMS:
+            for i in range(len(padded) - n + 1):
+                feats.append(zlib.crc32(padded[i:i + n]) % DIMS)
+    return feats
+
+
+def _counts(texts: Sequence[str]) -> sp.csr_matrix:
+    rows, cols = [], []
+    for r, text in enumerate(texts):
+        feats = _features(text)
+        rows.extend([r] * len(feats))
+        cols.extend(feats)
+    data = np.ones(len(cols), dtype=np.float32)
+    m = sp.csr_matrix((data, (rows, cols)), shape=(len(texts), DIMS), dtype=np.float32)
+    m.sum_duplicates()
+    return m
+
+
+def _normalize(m: sp.csr_matrix) -> sp.csr_matrix:
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms).dot(m), dtype=np.float32)
+
+
+# ---------------------------------------------------------
+# Index
+# ---------------------------------------------------------
+class SemanticIndex:
+    """
+    keys[i] is the key of column i of `by_feature`, the (DIMS x len(keys))
+    matrix of L2-normalized TF-IDF vectors. Stored feature-major, a query
+    only reads the rows of the features it contains. query() takes a
+    batch of texts and returns the top k (score, key) pairs for each.
+    """
+
+    def __init__(self, keys: List[str], by_feature: sp.csr_matrix, idf: np.ndarray):
+        self.keys = keys
+        self.by_feature = by_feature
+        self.idf = idf
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, keys: List[str], texts: Sequence[str]) -> "SemanticIndex":
+        counts = _counts(texts)
+        doc_freq = np.bincount(counts.indices, minlength=DIMS).astype(np.float32)
+        idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+        return cls(list(keys), cls._weigh(counts, idf).T.tocsr(), idf)
+
+    @staticmethod
+    def _weigh(counts: sp.csr_matrix, idf: np.ndarray) -> sp.csr_matrix:
+        counts = counts.copy()
+        counts.data = (1 + np.log(counts.data)) * idf[counts.indices]   # sublinear tf * idf
+        return _normalize(counts)
+
+    def vectorize(self, texts: Sequence[str]) -> sp.csr_matrix:
+        return self._weigh(_counts(texts), self.idf)
+
+    def query(
+        self,
+        texts: Sequence[str],
+        top_k: int = 5,
+        min_score: float = 0.0,
+    ) -> List[List[Tuple[float, str]]]:
+        """
+        Cosine top-k for a batch of query texts, best first.
+        """
+        if not texts or not self.keys:
+            return [[] for _ in texts]
+
+        scores = (self.vectorize(texts) @ self.by_feature).tocsr()
+        results = []
+        for r in range(scores.shape[0]):
+            start, end = scores.indptr[r], scores.indptr[r + 1]
+            vals, cols = scores.data[start:end], scores.indices[start:end]
+            keep = vals >= min_score
+            vals, cols = vals[keep], cols[keep]
+            if len(vals) > top_k:
+                part = np.argpartition(-vals, top_k)[:top_k]
+                vals, cols = vals[part], cols[part]
+            order = np.argsort(-vals, kind="stable")
+            results.append([(float(vals[i]), self.keys[cols[i]]) for i in order])
+        return results
+
+    # ---- persistence ----
+    def save(self, path: str, source: str = "") -> None:
+        """
+        Write the matrix as .npy arrays; the manifest is written last, so
+        an interrupted save is never loaded.
+        """
+        os.makedirs(path, exist_ok=True)
+        manifest = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest):
+            os.remove(manifest)
+
+        np.save(os.path.join(path, "data.npy"), self.by_feature.data)
+        np.save(os.path.join(path, "indices.npy"), self.by_feature.indices)
+        np.save(os.path.join(path, "indptr.npy"), self.by_feature.indptr)
+        np.save(os.path.join(path, "idf.npy"), self.idf)
+        with open(os.path.join(path, "keys.json"), "w", encoding="utf-8") as f:
+            json.dump(self.keys, f)
+
+        tmp = manifest + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "dims": DIMS, "ngrams": NGRAMS,
+                       "rows": len(self.keys), "source": source}, f)
+        os.replace(tmp, manifest)
+
+    @classmethod
+    def load(cls, path: str, source: str | None = None) -> "SemanticIndex | None":
+        """
+        Memory-map a saved index. Returns None if there is none, it was
+        built with other settings, or (when given) from another source.
+        """
+        try:
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if (manifest.get("version") != FORMAT_VERSION or manifest.get("dims") != DIMS
+                    or tuple(manifest.get("ngrams", ())) != NGRAMS):
+                return None
+            if source is not None and manifest.get("source") != source:
+                return None
+
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ("data", "indices", "indptr", "idf")
+            }
+            with open(os.path.join(path, "keys.json"), encoding="utf-8") as f:
+                keys = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        by_feature = sp.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(DIMS, len(keys)),
+            copy=False,
+        )
+        return cls(keys, by_feature, arrays["idf"])
+
+
+# ---------------------------------------------------------
+# Side-effect term index
+# ---------------------------------------------------------
+def term_text(term: str) -> str:
+    """
+    Text indexed for a side-effect term: the term plus its lay gloss.
+    """
+    gloss = LAY_GLOSSES.get(term.strip().lower())
+    return f"{term} {gloss}" if gloss else term
+
+
+def build_term_index() -> SemanticIndex:
+    with read_connection() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT lower(trim(side_effect)) FROM side_effects WHERE side_effect IS NOT NULL"
+        ).fetchall()
+    terms = sorted({r[0] for r in rows if r[0]})
+    return SemanticIndex.build(terms, [term_text(t) for t in terms])
+
+
+_term_index: SemanticIndex | None = None
+_term_index_lock = threading.Lock()
+
+
+def get_term_index() -> SemanticIndex:
+    """
+    The index of distinct side_effect terms: memory-mapped from INDEX_DIR
+    when it matches the current database file, otherwise rebuilt and saved.
+    """
+    global _term_index
+
+    if _term_index is None:
+        with _term_index_lock:
+            if _term_index is None:
+                source = file_fingerprint()
+                index = SemanticIndex.load(INDEX_DIR, source)
+                if index is None:
+                    index = build_term_index()
+                    try:
+                        index.save(INDEX_DIR, source)
+                    except OSError:
+                        pass        # read-only checkout: keep it in memory
+                _term_index = index
+
+    return _term_index
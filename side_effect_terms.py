@@ -0,0 +1,168 @@
+# side_effect_terms.py
+#
+# Side-effect term normalization and interning. "Headache", "headaches"
+# and "headache (mild)" all normalize to "headache" and share one integer
+# ID, so aggregations and source maps work on small integer arrays and
+# the context names each side effect once.
+
+import re
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+# Words that describe a side effect without changing which one it is
+QUALIFIERS = {
+    "mild", "moderate", "severe", "serious", "rare", "common", "uncommon",
+    "occasional", "frequent", "acute", "chronic", "transient", "possible",
+    "slight", "minor", "very", "some", "sudden", "persistent", "temporary",
+}
+
+# Words left as they are by the plural stemmer
+NO_STEM = {
+    "diabetes", "herpes", "rabies", "measles", "mumps", "scabies", "rickets",
+    "shingles", "hives", "aids", "lupus", "bowels",
+}
+
+# Spelling variants and synonyms -> preferred (patient-friendly) term.
+# Keys and values are already-normalized phrases.
+SYNONYMS = {
+    "diarrhoea": "diarrhea",
+    "oedema": "edema",
+    "oedema peripheral": "peripheral edema",
+    "edema peripheral": "peripheral edema",
+    "haematuria": "hematuria",
+    "anaemia": "anemia",
+    "dyspnoea": "shortness of breath",
+    "dyspnea": "shortness of breath",
+    "pyrexia": "fever",
+    "pruritus": "itching",
+    "itchiness": "itching",
+    "itch": "itching",
+    "emesis": "vomiting",
+    "throwing up": "vomiting",
+    "somnolence": "drowsiness",
+    "sleepiness": "drowsiness",
+    "cephalalgia": "headache",
+    "head ache": "headache",
+    "head pain": "headache",
+    "feeling sick": "nausea",
+    "queasiness": "nausea",
+    "dizzy": "dizziness",
+    "lightheadedness": "dizziness",
+    "light headedness": "dizziness",
+    "tiredness": "fatigue",
+    "urticaria": "hives",
+    "alopecia": "hair loss",
+    "arthralgia": "joint pain",
+    "myalgia": "muscle pain",
+    "insomnia": "trouble sleeping",
+    "syncope": "fainting",
+    "dyspepsia": "indigestion",
+    "skin rash": "rash",
+}
+
+_PARENTHETICAL = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+
+
+def _stem(word: str) -> str:
+    """
+    Plural -> singular, conservatively: "allergies" -> "allergy",
+    "rashes" -> "rash", "headaches" -> "headache"; words ending in
+    -ss/-us/-is and NO_STEM words are left alone.
+    """
+    if len(word) <= 3 or word in NO_STEM or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("shes", "xes", "sses", "zzes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_term(text: str) -> str:
+    """
+    Canonical form of a side-effect term: lower-cased, parentheticals,
+    punctuation and qualifiers removed, words singularized, synonyms
+    mapped to the preferred term.
+    """
+    text = _PARENTHETICAL.sub(" ", str(text).lower())
+    words = [w for w in re.findall(r"[a-z0-9]+", text) if w not in QUALIFIERS]
+    phrase = " ".join(_stem(w) for w in words)
+    return SYNONYMS.get(phrase, phrase)
+
+
+# ---------------------------------------------------------
+# Interning
+# ---------------------------------------------------------
+class TermInterner:
+    """
+    Normalized term <-> integer ID. IDs are assigned in first-seen order
+    and never change, so arrays of IDs stay valid for the whole session.
+    Raw strings are normalized once and remembered.
+    """
+
+    def __init__(self):
+        self.terms: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._raw: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def intern(self, raw: str) -> int:
+        """
+        ID of a raw term (-1 if it normalizes to nothing).
+        """
+        term_id = self._raw.get(raw)
+        if term_id is not None:
+            return term_id
+
+        term = normalize_term(raw)
+        with self._lock:
+            if not term:
+                term_id = -1
+            else:
+                term_id = self._ids.get(term)
+                if term_id is None:
+                    term_id = self._ids[term] = len(self.terms)
+                    self.terms.append(term)
+            self._raw[raw] = term_id
+        return term_id
+
+    def intern_many(self, values: Iterable) -> np.ndarray:
+        """
+        IDs for a column of raw terms; each distinct value is
+        normalized once. Missing values get -1.
+        """
+        if not isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+            values = pd.Series(list(values), dtype=object)
+        # Categorical columns (snapshot.py) factorize from their codes
+        codes, uniques = pd.factorize(values, sort=False)
+        ids = np.fromiter((self.intern(str(u)) for u in uniques), dtype=np.int64, count=len(uniques))
+        if not len(ids):
+            return np.full(len(codes), -1, dtype=np.int64)
+        return np.where(codes >= 0, ids[codes], -1)
+
+    def term(self, term_id: int) -> str:
+        return self.terms[term_id]
+
+
+_interner: TermInterner | None = None
+_interner_lock = threading.Lock()
+
+
+def get_interner() -> TermInterner:
+    global _interner
+
+    if _interner is None:
+        with _interner_lock:
+            if _interner is None:
+                _interner = TermInterner()
+
+    return _interner
@@ -0,0 +1,237 @@
+# snapshot.py
+#
+# Columnar snapshot of the side_effects table for fast startup.
+#
+# Each column is one .npy file: text columns are dictionary-encoded
+# (integer codes + a JSON list of categories), numeric columns are
+# float64. The files are memory-mapped read-only, so every Streamlit
+# worker shares the same pages through the OS page cache instead of
+# holding its own copy of the table.
+#
+# A snapshot lives in SNAPSHOT_DIR/<table>-<fingerprint>/ and is rebuilt
+# only when the database file changes.
+#
+# Usage: python snapshot.py [db_path] [--table side_effects]
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from db import DB_PATH, connect_readonly, file_fingerprint
+
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "DrugData/snapshot")
+CHUNK_ROWS = 200_000
+FORMAT_VERSION = 1
+REQUIRED_COLUMNS = ("medication", "side_effect")
+
+
+def clean_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Column names lower-cased; text trimmed, medication lower-cased.
+    """
+    df.columns = [c.strip().lower() for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            s = df[col].str.strip()
+            df[col] = s.str.lower() if col == "medication" else s
+    return df
+
+
+def _codes_dtype(n_categories: int) -> np.dtype:
+    # Same widths pandas picks for Categorical codes, so loading never copies
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def snapshot_path(db_path: str = DB_PATH, table: str = "side_effects",
+                  snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    key = hashlib.sha1(file_fingerprint(db_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(snapshot_dir, f"{table}-{key}")
+
+
+# ---------------------------------------------------------
+# Export
+# ---------------------------------------------------------
+def export_snapshot(db_path: str, table: str, path: str) -> None:
+    """
+    Stream the table out of SQLite in CHUNK_ROWS chunks into a snapshot
+    at `path`. Rows without a medication or side effect are skipped. A
+    column's kind is decided by its first chunk; later non-numeric values
+    in a numeric column become NaN.
+    Written to a temporary directory and renamed into place, so readers
+    never see a partial snapshot.
+    """
+    conn = connect_readonly(db_path)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        names = {r[1].strip().lower(): r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        missing = [c for c in REQUIRED_COLUMNS if c not in names]
+        if missing:
+            raise ValueError(
+                f"Missing required columns in SQLite table: {set(missing)}. "
+                "Ensure your table contains at least 'medication' and 'side_effect'."
+            )
+        where = " AND ".join(f'"{names[c]}" IS NOT NULL' for c in REQUIRED_COLUMNS)
+        n_rows = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}").fetchone()[0]
+
+        os.makedirs(tmp, exist_ok=True)
+        arrays: Dict[str, np.ndarray] = {}
+        kinds: Dict[str, str] = {}
+        dictionaries: Dict[str, Dict] = {}
+        pos = 0
+
+        for chunk in pd.read_sql_query(f"SELECT * FROM {table} WHERE {where}", conn, chunksize=CHUNK_ROWS):
+            chunk = clean_chunk(chunk)
+            end = pos + len(chunk)
+            for col in chunk.columns:
+                values = chunk[col]
+                if col not in kinds:
+                    numeric = is_numeric_dtype(values) and not is_bool_dtype(values)
+                    kinds[col] = "numeric" if numeric else "category"
+                    dtype = np.float64 if numeric else np.int32
+                    arrays[col] = np.lib.format.open_memmap(
+                        os.path.join(tmp, f"{col}.npy"), mode="w+", dtype=dtype, shape=(n_rows,)
+                    )
+                    dictionaries[col] = {}
+
+                if kinds[col] == "numeric":
+                    arrays[col][pos:end] = pd.to_numeric(values, errors="coerce").to_numpy(np.float64)
+                else:
+                    codes, uniques = pd.factorize(values, sort=False)
+                    mapping = dictionaries[col]
+                    remap = np.array([mapping.setdefault(u, len(mapping)) for u in uniques], dtype=np.int32)
+                    arrays[col][pos:end] = np.where(codes >= 0, remap[codes] if len(remap) else -1, -1)
+            pos = end
+
+        # Columns never seen (empty table) are all-missing text columns
+        for col in names:
+            if col not in kinds:
+                kinds[col] = "category"
+                dictionaries[col] = {}
+                arrays[col] = np.lib.format.open_memmap(
+                    os.path.join(tmp, f"{col}.npy"), mode="w+", dtype=np.int32, shape=(n_rows,)
+                )
+                arrays[col][:] = -1
+
+        columns = []
+        for col, kind in kinds.items():
+            arrays[col].flush()
+            entry = {"name": col, "kind": kind}
+            if kind == "category":
+                categories = list(dictionaries[col])
+                _narrow_codes(tmp, col, _codes_dtype(len(categories)))
+                with open(os.path.join(tmp, f"{col}.categories.json"), "w", encoding="utf-8") as f:
+                    json.dump(categories, f)
+            columns.append(entry)
+        arrays.clear()
+
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "source": file_fingerprint(db_path),
+                       "table": table, "rows": pos, "columns": columns}, f)
+
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another worker finished the same snapshot first
+            if not os.path.exists(os.path.join(path, "manifest.json")):
+                raise
+    finally:
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _narrow_codes(directory: str, col: str, dtype: np.dtype) -> None:
+    if dtype == np.int32:
+        return
+    src_path = os.path.join(directory, f"{col}.npy")
+    dst_path = os.path.join(directory, f"{col}.narrow.npy")
+    src = np.load(src_path, mmap_mode="r")
+    dst = np.lib.format.open_memmap(dst_path, mode="w+", dtype=dtype, shape=src.shape)
+    for i in range(0, len(src), CHUNK_ROWS):
+        dst[i:i + CHUNK_ROWS] = src[i:i + CHUNK_ROWS]
+    dst.flush()
+    del src, dst
+    os.replace(dst_path, src_path)
+
+
+def _remove_stale(snapshot_dir: str, table: str, keep: str) -> None:
+    # Safe while other processes still map the old files (POSIX unlink)
+    if not os.path.isdir(snapshot_dir):
+        return
+    for entry in os.listdir(snapshot_dir):
+        full = os.path.join(snapshot_dir, entry)
+        if entry.startswith(f"{table}-") and full != keep and ".tmp-" not in entry:
+            shutil.rmtree(full, ignore_errors=True)
+
+
+# ---------------------------------------------------------
+# Load
+# ---------------------------------------------------------
+def ensure_snapshot(db_path: str = DB_PATH, table: str = "side_effects",
+                    snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """
+    Path of an up-to-date snapshot, exporting it first if needed.
+    """
+    path = snapshot_path(db_path, table, snapshot_dir)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        export_snapshot(db_path, table, path)
+        _remove_stale(snapshot_dir, table, keep=path)
+    return path
+
+
+def load_snapshot(db_path: str = DB_PATH, table: str = "side_effects",
+                  snapshot_dir: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    The table as a DataFrame whose columns are read-only memory maps:
+    text columns are Categorical over the mapped codes, numeric columns
+    the mapped float64 arrays.
+    """
+    path = ensure_snapshot(db_path, table, snapshot_dir)
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != FORMAT_VERSION:
+        raise RuntimeError(f"Unsupported snapshot format in {path}")
+
+    data = {}
+    for col in manifest["columns"]:
+        name = col["name"]
+        values = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        if col["kind"] == "category":
+            with open(os.path.join(path, f"{name}.categories.json"), encoding="utf-8") as f:
+                categories: List = json.load(f)
+            # Codes were written by export_snapshot; skip the full-scan check
+            data[name] = pd.Categorical.from_codes(values, categories=categories, validate=False)
+        else:
+            data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a memory-mapped snapshot of a table.")
+    parser.add_argument("db_path", nargs="?", default=DB_PATH)
+    parser.add_argument("--table", default="side_effects")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path = ensure_snapshot(args.db_path, args.table, args.snapshot_dir)
+    print(f"Snapshot of {args.table} at {path} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# sql_guard.py
+#
+# Runs LLM-generated SQL with bounded rows, bounded time and no full
+# table scans on the large tables.
+
+import re
+import sqlite3
+import time
+from typing import Dict, List, Sequence
+
+import pandas as pd
+
+from db_queries import FTS_TABLE, TABLE
+
+
+MAX_ROWS = 200
+TIME_BUDGET = 2.0            # seconds a generated query may run
+PROGRESS_STEPS = 10_000      # VM instructions between deadline checks
+
+# Tables too large to scan per question.
+GUARDED_TABLES = {TABLE}
+
+
+class UnsafeQueryError(ValueError):
+    """Generated SQL is not a single read-only SELECT, or would scan a large table."""
+
+
+class QueryTimeoutError(RuntimeError):
+    """Generated SQL exceeded its time budget and was interrupted."""
+
+
+# ---------------------------------------------------------
+# Validation
+# ---------------------------------------------------------
+def validate_select(sql: str) -> str:
+    """
+    Strip code fences / trailing semicolons and make sure `sql` is a
+    single SELECT (or WITH ... SELECT) statement.
+    """
+    sql = re.sub(r"^```(?:sql)?|```$", "", sql.strip(), flags=re.IGNORECASE).strip()
+    sql = sql.rstrip().rstrip(";").strip()
+
+    if not re.match(r"(select|with)\b", sql, flags=re.IGNORECASE):
+        raise UnsafeQueryError(f"Not a SELECT statement: {sql[:80]}")
+
+    # Any remaining ';' outside string literals means several statements.
+    if ";" in re.sub(r"'(?:[^']|'')*'", "", sql):
+        raise UnsafeQueryError("Multiple SQL statements are not allowed")
+
+    return sql
+
+
+# ---------------------------------------------------------
+# Rewrite: LIKE '%x%' -> FTS5 lookup
+# ---------------------------------------------------------
+_LIKE = re.compile(
+    r"(?:lower\s*\(\s*)?\b(medication|side_effect|outcome)\b\s*\)?\s+like\s+'%([^'%_]+)%'",
+    re.IGNORECASE,
+)
+
+
+def _fts_literal(column: str, value: str) -> str | None:
+    tokens = re.findall(r"\w+", value.lower())
+    if not tokens:
+        return None
+    expr = f"{column.lower()} : (" + " AND ".join(f'"{t}"*' for t in tokens) + ")"
+    return "'" + expr.replace("'", "''") + "'"
+
+
+def rewrite_like_to_fts(sql: str) -> str:
+    """
+    Turn `[LOWER(]col[)] LIKE '%value%'` predicates, which SQLite can only
+    answer with a full scan, into rowid lookups against the FTS5 index:
+
+        rowid IN (SELECT rowid FROM side_effects_fts WHERE side_effects_fts MATCH '...')
+
+    FTS matching is token-prefix rather than raw substring, which is what
+    the generated LIKEs are trying to express anyway.
+    """
+    def replace(m: re.Match) -> str:
+        literal = _fts_literal(m.group(1), m.group(2))
+        if literal is None:
+            return m.group(0)
+        return f"rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH {literal})"
+
+    return _LIKE.sub(replace, sql)
+
+
+# ---------------------------------------------------------
+# Query-plan check
+# ---------------------------------------------------------
+def full_scans(conn: sqlite3.Connection, sql: str, params: Sequence | Dict = ()) -> List[str]:
+    """
+    EXPLAIN QUERY PLAN details that are full scans of a guarded table.
+    Index scans ("USING INDEX"), rowid lookups and virtual-table scans
+    are fine.
+    """
+    scans = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+        detail = row[-1]
+        m = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if not m or "VIRTUAL TABLE" in detail or "INDEX" in detail:
+            continue
+        if m.group(1) in GUARDED_TABLES or _is_alias_of_guarded(sql, m.group(1)):
+            scans.append(detail)
+    return scans
+
+
+def _is_alias_of_guarded(sql: str, name: str) -> bool:
+    for table in GUARDED_TABLES:
+        if re.search(rf"\b{table}\s+(?:as\s+)?{re.escape(name)}\b", sql, flags=re.IGNORECASE):
+            return True
+    return False
+
+
+# ---------------------------------------------------------
+# Execution
+# ---------------------------------------------------------
+def execute_guarded(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: Sequence | Dict = (),
+    max_rows: int = MAX_ROWS,
+    time_budget: float = TIME_BUDGET,
+) -> pd.DataFrame:
+    """
+    Run generated SQL safely:
+      1. validate it is one SELECT statement,
+      2. rewrite LIKE '%x%' predicates to FTS5 lookups,
+      3. reject plans that still full-scan a guarded table,
+      4. push the row limit into SQLite (SELECT * FROM (...) LIMIT n),
+      5. abort via the progress handler once `time_budget` is spent.
+
+    Raises UnsafeQueryError or QueryTimeoutError; callers fall back to
+    the indexed query path.
+    """
+    sql = rewrite_like_to_fts(validate_select(sql))
+
+    scans = full_scans(conn, sql, params)
+    if scans:
+        raise UnsafeQueryError(f"Query would scan a large table: {'; '.join(scans)}")
+
+    wrapped = f"SELECT * FROM (\n{sql}\n) LIMIT {int(max_rows)}"
+
+    deadline = time.monotonic() + time_budget
+    conn.set_progress_handler(lambda: int(time.monotonic() > deadline), PROGRESS_STEPS)
+    try:
+        return pd.read_sql_query(wrapped, conn, params=params)
+    except Exception as e:
+        if "interrupted" in str(e).lower():
+            raise QueryTimeoutError(f"Query exceeded {time_budget}s budget") from e
+        raise
+    finally:
+        # Connections are pooled; never leave the handler behind.
+        conn.set_progress_handler(None, 0)
@@ -0,0 +1,274 @@
+# sql_templates.py
+#
+# Reuses SQL for repeat question intents so the LLM is only asked to
+# write SQL for questions we have not seen the shape of before.
+#
+# A question only has an intent if everything it asks about is captured
+# by slots: the medication, outcome words and a side effect that exists
+# in the database. Anything else ("Is it safe during pregnancy?") goes
+# to the LLM, and its SQL is not reused.
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Set
+
+from semantic_index import get_term_index
+from side_effect_terms import normalize_term
+
+
+TEMPLATES_PATH = os.getenv("SQL_TEMPLATES_PATH", "DrugData/sql_templates.json")
+
+# Question words -> FAERS outcome codes
+OUTCOME_PATTERNS = [
+    (re.compile(r"^(death|died$|dies$|die$|dying$|fatal)"), "DE"),
+    (re.compile(r"^life-threat"), "LT"),
+    (re.compile(r"^hospital"), "HO"),
+    (re.compile(r"^disab"), "DS"),
+    (re.compile(r"^(congenital|birth$)"), "CA"),
+    (re.compile(r"^intervention"), "RI"),
+]
+
+# Words that describe the question, not the side effect asked about.
+FILLER_WORDS = {
+    "a", "about", "adverse", "after", "all", "an", "and", "any", "anyone",
+    "are", "be", "been", "can", "cause", "caused", "causes", "causing",
+    "common", "could", "defect", "defects", "did", "do", "does", "effect",
+    "effects", "events", "for", "frequent", "from", "get", "give", "happen",
+    "has", "have", "how", "i", "in", "is", "it", "its", "known", "list",
+    "lead", "linked", "me", "most", "my", "of", "often", "on", "or",
+    "patient", "patients", "people", "reaction", "reactions", "report",
+    "reported", "reports", "risk", "risks", "serious", "show", "side",
+    "someone", "stay", "stays", "take", "taking", "tell", "the", "there",
+    "to", "usually", "was", "were", "what", "when", "which", "who", "will",
+    "with", "you",
+}
+
+# Built-in templates for the everyday intents. ":name" placeholders are
+# replaced by the escaped slot value; sql_guard later turns the LIKEs
+# into FTS5 lookups.
+_MED = "LOWER(medication) LIKE '%:medication%'"
+SEED_TEMPLATES = {
+    "med/list/0": f"SELECT * FROM side_effects WHERE {_MED}",
+    "med/term/0": f"SELECT * FROM side_effects WHERE {_MED} AND LOWER(side_effect) LIKE '%:term%'",
+    "med/list/1": f"SELECT * FROM side_effects WHERE {_MED} AND outcome LIKE '%:outcome0%'",
+    "med/term/1": (
+        f"SELECT * FROM side_effects WHERE {_MED} "
+        "AND LOWER(side_effect) LIKE '%:term%' AND outcome LIKE '%:outcome0%'"
+    ),
+}
+
+
+# Signature of a question with no medication, term or outcome slots
+NO_SLOTS_SIGNATURE = "any/list/0"
+
+
+class Intent(NamedTuple):
+    signature: str
+    slots: Dict[str, str]
+
+
+# ---------------------------------------------------------
+# Question -> intent + slots
+# ---------------------------------------------------------
+def _clean(value: str) -> str:
+    # Slot values end up inside SQL string literals: keep them boring.
+    return re.sub(r"[^a-z0-9 \-]", "", value.lower()).strip()
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 4 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if re.search(r"(sh|ch|x|ss)es$", word):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def known_terms() -> Set[str]:
+    """
+    Distinct side_effect values of the database, lower-cased: the only
+    phrases accepted as a term slot. Empty if the database is
+    unavailable, which sends every question naming a side effect to the
+    LLM.
+    """
+    try:
+        return set(get_term_index().keys)
+    except Exception:
+        return set()
+
+
+def parse_intent(question: str, medication: str | None, terms: Set[str]) -> Intent | None:
+    """
+    Reduce a question to a signature and slot values, e.g.
+
+        ("Does ondansetron cause headaches?", "ondansetron")
+            -> Intent("med/term/0", {"medication": "ondansetron", "term": "headache"})
+
+    None if the words left after the medication, outcomes and filler are
+    not one of `terms` ("Does it interact with alcohol?").
+    """
+    slots: Dict[str, str] = {}
+    med = _clean(medication or "")
+    if med:
+        slots["medication"] = med
+
+    words = re.findall(r"[a-z][a-z\-]*", question.lower())
+    med_words = set(med.split())
+
+    outcomes: List[str] = []
+    term_words: List[str] = []
+    for w in words:
+        code = next((c for pattern, c in OUTCOME_PATTERNS if pattern.match(w)), None)
+        if code:
+            if code not in outcomes:
+                outcomes.append(code)
+        elif w not in FILLER_WORDS and w not in med_words:
+            term_words.append(w)
+
+    for i, code in enumerate(outcomes):
+        slots[f"outcome{i}"] = code
+
+    if term_words:
+        phrase = _clean(" ".join(term_words))
+        # Singular form matches plurals too under LIKE '%x%'
+        singular = _clean(" ".join(term_words[:-1] + [_singular(term_words[-1])]))
+        term = next((t for t in (singular, normalize_term(phrase), phrase) if t in terms), None)
+        if term is None:
+            return None
+        slots["term"] = term
+
+    signature = "/".join([
+        "med" if med else "any",
+        "term" if "term" in slots else "list",
+        str(len(outcomes)),
+    ])
+    return Intent(signature, slots)
+
+
+# ---------------------------------------------------------
+# Template store
+# ---------------------------------------------------------
+def render(template: str, slots: Dict[str, str]) -> str:
+    # Longest names first so ":outcome10" is not clobbered by ":outcome1"
+    sql = template
+    for name in sorted(slots, key=len, reverse=True):
+        sql = sql.replace(f":{name}", slots[name].replace("'", "''"))
+    return sql
+
+
+def parameterize(sql: str, slots: Dict[str, str]) -> str | None:
+    """
+    Turn concrete generated SQL back into a template by replacing each
+    slot value inside string literals with its placeholder. Returns None
+    if some slot value does not appear, i.e. the SQL is not reusable.
+    """
+    template = sql
+    for name in sorted(slots, key=lambda n: len(slots[n]), reverse=True):
+        value = slots[name]
+        pattern = re.compile(r"('(?:[^']|'')*')")
+        found = False
+
+        def replace(m: re.Match) -> str:
+            nonlocal found
+            literal, n = re.subn(
+                rf"(?<![a-z0-9]){re.escape(value)}(?![a-z0-9])",
+                f":{name}",
+                m.group(1),
+                flags=re.IGNORECASE,
+            )
+            found = found or n > 0
+            return literal
+
+        template = pattern.sub(replace, template)
+        if not found:
+            return None
+
+    return template
+
+
+class TemplateCache:
+    """
+    signature -> SQL template, persisted as JSON. Seeded with
+    SEED_TEMPLATES; templates learned from LLM output are added on a miss.
+    `terms` is the side-effect vocabulary (default: known_terms(), loaded
+    on first use).
+    """
+
+    def __init__(self, path: str = TEMPLATES_PATH, terms: Set[str] | None = None):
+        self.path = path
+        self._terms = terms
+        self.templates: Dict[str, str] = dict(SEED_TEMPLATES)
+        self.stats = {"hits": 0, "misses": 0, "learned": 0}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    learned = json.load(f)
+                # Learned before slotless questions were excluded
+                learned.pop(NO_SLOTS_SIGNATURE, None)
+                self.templates.update(learned)
+            except (OSError, ValueError):
+                pass
+
+    @property
+    def terms(self) -> Set[str]:
+        if self._terms is None:
+            with self._lock:
+                if self._terms is None:
+                    self._terms = known_terms()
+        return self._terms
+
+    def lookup(self, question: str, medication: str | None) -> str | None:
+        intent = parse_intent(question, medication, self.terms)
+        template = self.templates.get(intent.signature) if intent else None
+        if template is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return render(template, intent.slots)
+
+    def learn(self, question: str, medication: str | None, sql: str) -> bool:
+        intent = parse_intent(question, medication, self.terms)
+        if intent is None or not intent.slots:
+            # Without slots the SQL is specific to this one question
+            return False
+        template = parameterize(sql, intent.slots)
+        if template is None:
+            return False
+
+        with self._lock:
+            self.templates[intent.signature] = template
+            self.stats["learned"] += 1
+            self._save_locked()
+        return True
+
+    def _save_locked(self) -> None:
+        learned = {k: v for k, v in self.templates.items() if SEED_TEMPLATES.get(k) != v}
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(learned, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+_cache: TemplateCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> TemplateCache:
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TemplateCache()
+
+    return _cache